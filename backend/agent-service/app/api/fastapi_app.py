@@ -3,6 +3,7 @@ import subprocess
 import json
 import uuid
 import sys
+import time
 import asyncio
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
@@ -11,24 +12,40 @@ from typing import List, Dict, Any
 import logging
 from shlex import quote
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.requests import Request
 
-# Import your existing graph builder
-from final import build_orchestral_flow
+# Process-wide models, clients and compiled graph (built once at startup)
+from registry import init_registry, get_registry
+from final import new_run_state, iter_workflow_events
+from job_queue import Job, JobManager, QueueFullError
+from scraper_engine import BrowserPool
+from llm_cache import cache_stats
+from report_store import flush as flush_reports
 
 
 # --- Configuration ---
 # This is the URL the scraper will target.
 # You can change this to any other tender website.
 UPLOAD_PATH = "Nit_jsr.pdf"
-FINAL_OUTPUT_PATH = "final_rfp_response.json"
 
 SCRAPER_TARGET_URL = "https://nitjsr.ac.in/Tender/All_Tenders"
 SCRAPER_SCRIPT_PATH = "playwright_scraper.py"
 MANIFEST_PATH = "scraped_rfps_manifest.json"
+SCRAPER_DOWNLOAD_DIR = "data/raw"
+SCRAPER_MAX_CANDIDATES = 50
+
+# "engine" scrapes in-process on a warm, shared browser; "subprocess" runs playwright_scraper.py per request
+SCRAPER_MODE = os.getenv("SCRAPER_MODE", "engine")
+SCRAPER_MAX_CONTEXTS = int(os.getenv("SCRAPER_MAX_CONTEXTS", "4"))
+
+# Background agent jobs: worker threads running workflows, and max jobs waiting for a worker
+AGENT_JOB_WORKERS = int(os.getenv("AGENT_JOB_WORKERS", "2"))
+AGENT_JOB_MAX_QUEUED = int(os.getenv("AGENT_JOB_MAX_QUEUED", "50"))
+# How long shutdown waits for queued report writes
+REPORT_FLUSH_TIMEOUT_S = 30
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s")
 logger = logging.getLogger(__name__)
@@ -59,7 +76,7 @@ class TechnicalMatchRequest(BaseModel):
     db_context: Dict[str, Any]
 
 class InvokeAgentRequest(BaseModel):
-    pdf_path: str
+    pdf_path: str = UPLOAD_PATH
 
 # --- Helper Function ---
 def format_scraper_results(manifest_data: List[Dict]) -> List[Dict]:
@@ -82,12 +99,67 @@ def format_scraper_results(manifest_data: List[Dict]) -> List[Dict]:
     return formatted_rfps
 
 
+def run_agent_job(job: Job) -> Dict[str, Any]:
+    """Runs one workflow for a queued job, reporting per-node progress as it goes."""
+    run_state = new_run_state(job.payload["pdf_path"], run_id=job.id)
+    completed_nodes: List[str] = []
+    job.update_progress(run_id=run_state["run_id"], completed_nodes=completed_nodes, last_node=None)
+
+    final_response = None
+    started = time.perf_counter()
+    for update in get_registry().graph.stream(run_state, stream_mode="updates"):
+        for node, node_update in update.items():
+            completed_nodes.append(node)
+            changes = {"completed_nodes": list(completed_nodes), "last_node": node}
+            if isinstance(node_update, dict):
+                products = node_update.get("rfp_summary", {}).get("Technical_Summary", {}).get("Products_In_Scope")
+                if products is not None:
+                    changes["products_total"] = len(products)
+                if "final_response" in node_update:
+                    final_response = node_update["final_response"]
+            if node == "Product_Agent":
+                changes["products_done"] = completed_nodes.count("Product_Agent")
+            job.update_progress(**changes)
+
+    logger.info("Job %s finished in %.2fs", job.id, time.perf_counter() - started)
+    if final_response is None:
+        raise RuntimeError("Workflow finished but produced no final response.")
+    return final_response
+
+
+job_manager = JobManager(run_agent_job, max_workers=AGENT_JOB_WORKERS, max_queued=AGENT_JOB_MAX_QUEUED)
+browser_pool = BrowserPool(headless=True, max_contexts=SCRAPER_MAX_CONTEXTS)
+
+
 # --- API Endpoints ---
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Backend server starting up...")
     logger.info(f"Scraper will target URL: {SCRAPER_TARGET_URL}")
+    try:
+        # Loading the embedding model and building clients blocks, so keep it off the event loop.
+        await asyncio.to_thread(init_registry)
+        logger.info("Agent registry initialized (LLM clients, embeddings, OEM index, compiled graph).")
+    except Exception:
+        # Requests will retry the initialization through get_registry().
+        logger.exception("Agent registry initialization failed; it will be retried on the first request.")
+
+    if SCRAPER_MODE == "engine":
+        try:
+            await browser_pool.start()
+        except Exception:
+            logger.exception("Could not launch the scraper browser; /scraper/run will use the subprocess scraper.")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Drop jobs that have not started yet; running workflows finish in their threads.
+    job_manager.shutdown(wait=False)
+    if browser_pool.running:
+        await browser_pool.stop()
+    # Reports are written in the background; don't lose the ones still queued.
+    await asyncio.to_thread(flush_reports, REPORT_FLUSH_TIMEOUT_S)
 
 
 @app.get("/")
@@ -95,8 +167,50 @@ def read_root():
     """Root endpoint to check if the server is running and reachable."""
     return {"status": "Alpine Backend is running and reachable!"}
 
+@app.get("/health")
+def health():
+    """Liveness plus cache and scraper browser status."""
+    return {
+        "status": "ok",
+        "llm_cache": cache_stats(),
+        "scraper_browser_running": browser_pool.running,
+    }
+
+
 @app.post("/scraper/run")
 async def run_scraper():
+    """
+    Runs the scraper on the app's warm browser pool when it is available, otherwise
+    falls back to running the scraper script in a subprocess.
+    """
+    if SCRAPER_MODE == "engine" and browser_pool.running:
+        return await run_scraper_engine()
+    return await run_scraper_subprocess()
+
+
+async def run_scraper_engine():
+    """Scrapes in-process with a pooled browser context (no interpreter or browser start-up)."""
+    logger.info("Received request to run the web scraper (in-process engine)...")
+    try:
+        started = time.perf_counter()
+        scraped_data = await asyncio.wait_for(
+            browser_pool.run_scrape(SCRAPER_TARGET_URL, SCRAPER_DOWNLOAD_DIR, SCRAPER_MAX_CANDIDATES, MANIFEST_PATH),
+            timeout=300,
+        )
+        logger.info("Scrape finished in %.2fs", time.perf_counter() - started)
+    except asyncio.TimeoutError:
+        logger.error("Scraper timed out after 5 minutes.")
+        raise HTTPException(status_code=504, detail="Scraper timed out after 5 minutes.")
+    except Exception as e:
+        logger.exception("An unexpected error occurred during scraper execution.")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    formatted_data = format_scraper_results(scraped_data)
+    logger.info("Returning %d formatted RFP(s) to frontend.", len(formatted_data))
+    return formatted_data
+
+
+async def run_scraper_subprocess():
     """
     Executes the Playwright scraper script as an async-safe subprocess using the
     same Python interpreter currently running this FastAPI app (sys.executable).
@@ -171,36 +285,122 @@ async def run_scraper():
 @app.post("/agent/invoke")
 async def invoke_main_agent(request: InvokeAgentRequest):
     """
-    Triggers the LangGraph Workflow defined in final.py.
+    Triggers the LangGraph Workflow defined in final.py for the PDF in the request.
+    Every call runs in its own workspace (run ID + report directory), so concurrent
+    requests don't share state or output files.
     """
-    if not os.path.exists(UPLOAD_PATH):
-        raise HTTPException(status_code=400, detail="Please upload an RFP PDF first.")
+    pdf_path = request.pdf_path or UPLOAD_PATH
+    if not os.path.exists(pdf_path):
+        raise HTTPException(status_code=400, detail=f"RFP PDF not found: {pdf_path}. Please upload an RFP PDF first.")
 
     try:
-        print("🚀 API: Starting LangGraph Workflow...")
-
-        # Initialize and compile the graph from your final.py
-        graph = build_orchestral_flow()
-        executor = graph.compile()
+        run_state = new_run_state(pdf_path)
+        logger.info("🚀 API: Starting LangGraph Workflow (run %s, pdf %s)...", run_state["run_id"], pdf_path)
 
-        # Execute the workflow
-        # We pass an empty dict as initial state, just like in your main block
-        executor.invoke({})
+        # Reuse the graph compiled at startup
+        executor = get_registry().graph
 
-        # Verify output exists
-        if not os.path.exists(FINAL_OUTPUT_PATH):
-            raise HTTPException(status_code=500, detail="Workflow finished but no output file found.")
+        # Execute the workflow in a worker thread so other requests keep being served
+        started = time.perf_counter()
+        final_state = await asyncio.to_thread(executor.invoke, run_state)
+        logger.info("Run %s finished in %.2fs", run_state["run_id"], time.perf_counter() - started)
 
-        # Load and return the final JSON
-        with open(FINAL_OUTPUT_PATH, "r", encoding="utf-8") as f:
-            result = json.load(f)
+        # The final response comes back in the graph state (the report file is written asynchronously)
+        result = final_state.get("final_response")
+        if result is None:
+            raise HTTPException(status_code=500, detail="Workflow finished but produced no final response.")
 
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ API Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 
+@app.post("/agent/jobs", status_code=202)
+async def create_agent_job(request: InvokeAgentRequest):
+    """
+    Enqueues a workflow run for the PDF in the request and returns immediately with
+    a job ID. Poll GET /agent/jobs/{job_id} for status, progress and the result.
+    """
+    pdf_path = request.pdf_path or UPLOAD_PATH
+    if not os.path.exists(pdf_path):
+        raise HTTPException(status_code=400, detail=f"RFP PDF not found: {pdf_path}. Please upload an RFP PDF first.")
+
+    try:
+        job = job_manager.submit({"pdf_path": pdf_path})
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    logger.info("Queued agent job %s for %s", job.id, pdf_path)
+    return job.to_dict(include_result=False)
+
+
+@app.get("/agent/jobs/{job_id}")
+async def get_agent_job(job_id: str):
+    """Returns a job's status and progress, plus its result once it has succeeded."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """One server-sent event; the event name comes from the payload's "event" key."""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event.get('event', 'message')}\ndata: {data}\n\n"
+
+
+@app.get("/agent/stream")
+async def stream_agent(pdf_path: str = UPLOAD_PATH):
+    """
+    Runs the workflow and streams progress as server-sent events: one
+    "chunk_completed" per map chunk, one "node_completed" (with partial results such
+    as RFP_Metadata) per graph node, and a final "run_completed" or "run_failed".
+    """
+    if not os.path.exists(pdf_path):
+        raise HTTPException(status_code=400, detail=f"RFP PDF not found: {pdf_path}. Please upload an RFP PDF first.")
+
+    run_state = new_run_state(pdf_path)
+    executor = get_registry().graph
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def produce():
+        # Runs in a worker thread; hands events to the event loop as they happen.
+        try:
+            for event in iter_workflow_events(executor, run_state):
+                loop.call_soon_threadsafe(events.put_nowait, event)
+            loop.call_soon_threadsafe(events.put_nowait, {"event": "run_completed", "run_id": run_state["run_id"]})
+        except Exception as e:
+            logger.exception("Streaming run %s failed.", run_state["run_id"])
+            loop.call_soon_threadsafe(events.put_nowait, {"event": "run_failed", "error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, done)
+
+    async def event_source():
+        yield format_sse({"event": "run_started", "run_id": run_state["run_id"], "pdf_path": pdf_path})
+        worker = asyncio.create_task(asyncio.to_thread(produce))
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                yield format_sse(event)
+        finally:
+            # If the client disconnects the run still finishes in its thread.
+            if worker.done():
+                worker.result()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --- To run this server, use the command (from your project root):
 #  uvicorn fastapi_app:app --reload --host 0.0.0.0 --port 8000
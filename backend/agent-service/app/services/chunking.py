@@ -0,0 +1,224 @@
+"""
+chunking.py
+
+Token-budget chunking of RFP text for the map stage.
+
+Chunk sizes are measured in model tokens, using the Qwen tokenizer when the
+optional `transformers` package (and the tokenizer files) are available, and a
+~4 characters/token estimate otherwise. Text is packed line by line up to the
+budget; when a chunk is full it is cut at the last section/heading start in its
+second half, so a section rarely straddles two chunks and no overlap is needed.
+
+`iter_content_defined_chunks` picks boundaries from the content itself (the
+heading, or failing that the line with the highest hash, in a window of the
+buffer) instead of from the running token count, so a local edit in a revised RFP
+only changes the chunks around it and every other chunk keeps exactly the same text.
+
+Usage:
+    for chunk in iter_token_chunks(pages, token_budget=6000):
+        ...
+"""
+
+import os
+import re
+import zlib
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# CONFIG
+# Tokenizer used to measure chunks; must match the map model.
+MAP_TOKENIZER = os.getenv("MAP_TOKENIZER", "Qwen/Qwen2.5-Coder-32B-Instruct")
+# A chunk is only cut at a heading if that keeps at least this share of the budget filled.
+HEADING_CUT_MIN_FILL = 0.5
+# Content-defined chunks are cut somewhere between this share of the budget and the full budget.
+CDC_MIN_FILL = 0.5
+
+# Lines that start a new section: "SECTION 3", "Annexure-II", "Clause 7", "4.2 Scope of Work",
+# "12) Delivery", or a short all-caps title such as "GENERAL TERMS AND CONDITIONS".
+HEADING_PATTERN = re.compile(
+    r"^\s*(?:"
+    r"(?i:section|chapter|part|annexure|annex|appendix|schedule|clause|form)[\s\-:]*(?:\d+|[IVXLC]+|[A-Z])\b"
+    r"|\d{1,2}(?:\.\d{1,2}){0,3}[.)]?\s+[A-Z]"
+    r"|[A-Z][A-Z0-9 &/,:()\-]{3,80}$"
+    r")"
+)
+
+# Page number lines ("12", "Page 3 of 40", "- 7 -") shift when pages are added or removed.
+PAGE_NUMBER_PATTERN = re.compile(r"^\s*(?:page\s*)?[-\u2013]?\s*\d{1,4}\s*[-\u2013]?\s*(?:of\s*\d{1,4})?\s*$", re.IGNORECASE)
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough estimate (~4 characters per token) - used when the tokenizer is unavailable
+    # and to size reduce groups.
+    return max(1, len(text) // 4)
+
+
+def get_tokenizer():
+    """The map model's tokenizer, or None when transformers or the tokenizer files are unavailable."""
+    global _tokenizer, _tokenizer_loaded
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            _tokenizer_loaded = True
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(MAP_TOKENIZER)
+            except Exception as e:
+                print(f"⚠️ Tokenizer {MAP_TOKENIZER} unavailable ({e}); estimating tokens from length.")
+                _tokenizer = None
+        return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def is_heading(line: str) -> bool:
+    return bool(HEADING_PATTERN.match(line))
+
+
+def _split_oversized(line: str, token_budget: int, count: Callable[[str], int]) -> List[str]:
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=token_budget,
+        chunk_overlap=0,
+        length_function=count,
+        separators=[". ", " ", ""],
+    )
+    return splitter.split_text(line)
+
+
+def iter_token_chunks(pages: Iterable[str], token_budget: int,
+                      count: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    """
+    Packs the lines of a stream of pages into chunks of at most `token_budget` tokens.
+    A full chunk is cut before its last heading if that keeps it at least
+    HEADING_CUT_MIN_FILL full (the heading and what follows start the next chunk);
+    otherwise it is cut at the line boundary. A single line longer than the budget
+    is split on sentence/word boundaries.
+    """
+    count = count or count_tokens
+    lines: List[str] = []
+    sizes: List[int] = []
+    headings: List[int] = []  # indices into `lines` where a heading starts
+    total = 0
+
+    def cut() -> str:
+        """Removes and returns the first chunk from the buffer."""
+        nonlocal lines, sizes, headings, total
+        min_fill = HEADING_CUT_MIN_FILL * token_budget
+        end = len(lines)
+        for idx in reversed(headings):
+            if sum(sizes[:idx]) >= min_fill:
+                end = idx
+                break
+        chunk = "\n".join(lines[:end])
+        total -= sum(sizes[:end])
+        lines, sizes = lines[end:], sizes[end:]
+        headings = [idx - end for idx in headings if idx > end]
+        return chunk
+
+    first_page = True
+    for page in pages:
+        # Keep the blank line that read_pdf_text puts between pages
+        page_lines = page.split("\n")
+        if not first_page:
+            page_lines = [""] + page_lines
+        first_page = False
+
+        for line in page_lines:
+            size = count(line) + 1  # + newline
+            while lines and total + size > token_budget:
+                chunk = cut()
+                if chunk.strip():
+                    yield chunk
+
+            if size > token_budget:
+                yield from _split_oversized(line, token_budget, count)
+                continue
+
+            if lines and is_heading(line):
+                headings.append(len(lines))
+            lines.append(line)
+            sizes.append(size)
+            total += size
+
+    # The remainder always fits the budget
+    chunk = "\n".join(lines)
+    if chunk.strip():
+        yield chunk
+
+
+def boundary_rank(line: str) -> tuple:
+    """How strongly a content-defined chunk prefers to start at `line`: headings first, then a hash of the text."""
+    normalized = " ".join(line.split())
+    if not normalized:
+        return (-1, 0)
+    return (int(is_heading(line)), zlib.crc32(normalized.encode("utf-8")))
+
+
+def iter_content_defined_chunks(pages: Iterable[str], token_budget: int,
+                                count: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    """
+    Packs lines into chunks of at most `token_budget` tokens. When the buffer is full,
+    the chunk is cut before the highest-ranked line (see boundary_rank) among those
+    that keep it at least CDC_MIN_FILL full. The cut depends only on the lines in that
+    window, so after an edit the windows of the old and new text soon overlap on the
+    same best line and every later boundary (and chunk) is the same as before.
+
+    Page breaks and page numbers at the top/bottom of a page are dropped, since they
+    move whenever pages are inserted or removed.
+    """
+    count = count or count_tokens
+    min_fill = CDC_MIN_FILL * token_budget
+    lines: List[str] = []
+    sizes: List[int] = []
+    total = 0
+
+    def cut() -> str:
+        nonlocal lines, sizes, total
+        end, filled, best = len(lines), 0, None
+        for idx in range(1, len(lines)):
+            filled += sizes[idx - 1]
+            if filled >= min_fill:
+                rank = boundary_rank(lines[idx])
+                if best is None or rank > best:
+                    end, best = idx, rank
+        chunk = "\n".join(lines[:end])
+        total -= sum(sizes[:end])
+        lines, sizes = lines[end:], sizes[end:]
+        return chunk
+
+    for page in pages:
+        page_lines = page.split("\n")
+        # Headers/footers: page numbers at the top or bottom of the page
+        while page_lines and (not page_lines[0].strip() or PAGE_NUMBER_PATTERN.match(page_lines[0])):
+            page_lines.pop(0)
+        while page_lines and (not page_lines[-1].strip() or PAGE_NUMBER_PATTERN.match(page_lines[-1])):
+            page_lines.pop()
+
+        for line in page_lines:
+            size = count(line) + 1  # + newline
+            while lines and total + size > token_budget:
+                chunk = cut()
+                if chunk.strip():
+                    yield chunk
+
+            if size > token_budget:
+                yield from _split_oversized(line, token_budget, count)
+                continue
+
+            lines.append(line)
+            sizes.append(size)
+            total += size
+
+    chunk = "\n".join(lines)
+    if chunk.strip():
+        yield chunk
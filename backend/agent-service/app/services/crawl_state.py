@@ -0,0 +1,99 @@
+"""
+crawl_state.py
+
+Persistent crawl state for the tender scraper, keyed by PDF URL.
+
+For every document we have downloaded we remember the validators the server sent
+(ETag / Last-Modified), the SHA-256 of the content and where it was saved. The
+next scrape sends conditional requests with those validators, so unchanged
+tenders cost a 304 instead of a full download, and only new or changed tenders
+end up in the manifest.
+
+Usage:
+    state = get_crawl_state()
+    known = state.get(url)          # None if the URL was never downloaded
+    state.record(url, path, sha256, etag, last_modified)
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+# CONFIG
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH", "./lib/cache/crawl_state.sqlite3")
+
+_COLUMNS = ("url", "path", "content_hash", "etag", "last_modified", "first_seen", "last_checked", "last_changed")
+
+
+class CrawlStateStore:
+    """SQLite table of downloaded documents: validators, content hash and local path per URL."""
+
+    def __init__(self, path: str = CRAWL_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One shared connection; every access goes through self._lock.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " url TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " first_seen REAL NOT NULL,"
+            " last_checked REAL NOT NULL,"
+            " last_changed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM documents WHERE url = ?", (url,)
+            ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def record(self, url: str, path: str, content_hash: str,
+               etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Stores the latest download of `url`; last_changed only moves when the content hash does."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO documents (url, path, content_hash, etag, last_modified, first_seen, last_checked, last_changed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(url) DO UPDATE SET"
+                "  last_changed = CASE WHEN documents.content_hash = excluded.content_hash"
+                "                 THEN documents.last_changed ELSE excluded.last_changed END,"
+                "  path = excluded.path, content_hash = excluded.content_hash, etag = excluded.etag,"
+                "  last_modified = excluded.last_modified, last_checked = excluded.last_checked",
+                (url, path, content_hash, etag, last_modified, now, now, now),
+            )
+            self._conn.commit()
+
+    def touch(self, url: str) -> None:
+        """Marks `url` as checked (e.g. after a 304) without changing what we know about it."""
+        with self._lock:
+            self._conn.execute("UPDATE documents SET last_checked = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {"path": self.path, "documents": documents}
+
+
+_store: Optional[CrawlStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_crawl_state() -> CrawlStateStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CrawlStateStore()
+        return _store
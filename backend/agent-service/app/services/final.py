@@ -1,10 +1,19 @@
-import json
-from langgraph.graph import StateGraph, END
+import os
+import uuid
+import shutil
+import operator
+from typing import Any, Annotated, Dict, List, TypedDict
+from langgraph.config import get_stream_writer
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
+from langchain_core.output_parsers import StrOutputParser
 
 # Import the actual agent pipelines (assuming these load/run the agents and save files)
-from main_agent_module import main_agent_pipeline
-from technical_agent_module import technical_agent_pipeline
-from pricing_agent_module import pricing_agent_llm_pipeline
+from main_agent_module import main_agent_pipeline, PDF_PATH
+from technical_agent_module import technical_agent_pipeline, TECH_PROMPT, find_top_matches_batch, recommend_products
+from pricing_agent_module import pricing_agent_pipeline, pricing_agent_llm_pipeline, price_recommendation, grand_total
+from registry import get_registry
+from report_store import persist_json, flush as flush_reports
 
 # --- CONFIG ---
 # Define the paths where the downstream agents will save their outputs
@@ -12,68 +21,151 @@ RFP_JSON_PATH = "./lib/reports/rfp_summary.json"
 TECH_OUTPUT_PATH = "./lib/reports/technical_agent_output.json"
 OUTPUT_PRICING_JSON = "./lib/reports/pricing_agent_output.json"
 FINAL_RESPONSE_PATH = "./lib/reports/final_rfp_response.json"
+# Each API run gets its own workspace: ./lib/runs/<run_id>/<report>.json
+RUNS_DIR = "./lib/runs"
+# Only the most recent run workspaces are kept (0 keeps them all)
+RUNS_KEEP = int(os.getenv("RUNS_KEEP", "200"))
+# "engine" prices in code (deterministic); "llm" uses the PRICING_PROMPT pipeline
+PRICING_MODE = os.getenv("PRICING_MODE", "engine")
+# "parallel" fans out per product (see build_parallel_flow); "sequential" is the original chain
+GRAPH_VARIANT = os.getenv("GRAPH_VARIANT", "parallel")
+# Max nodes running at once in a superstep. In the parallel variant this bounds the
+# per-product technical LLM calls and replaces TECH_MAX_CONCURRENCY.
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", "4"))
+
+
+class RFPState(TypedDict, total=False):
+    """Workflow state. `product_results` is appended to by parallel per-product branches."""
+    run_id: str
+    pdf_path: str
+    report_dir: str
+    rfp_summary: Dict[str, Any]
+    technical_output: Dict[str, Any]
+    pricing_output: Dict[str, Any]
+    final_response: Dict[str, Any]
+    catalog_ready: bool
+    product_matches: List[List[Dict[str, Any]]]
+    product_results: Annotated[List[Dict[str, Any]], operator.add]
+
+
+class ProductTask(TypedDict):
+    """Input of one per-product branch."""
+    index: int
+    product: str
+    matches: List[Dict[str, Any]]
+    rfp_summary: Dict[str, Any]
+
+
+# === RUN WORKSPACES ===
+def new_run_state(pdf_path: str, run_id: str = None) -> dict:
+    """Initial state for one isolated run: its own ID, input PDF and report directory."""
+    run_id = run_id or uuid.uuid4().hex
+    report_dir = os.path.join(RUNS_DIR, run_id)
+    os.makedirs(report_dir, exist_ok=True)
+    prune_runs(keep=RUNS_KEEP, runs_dir=RUNS_DIR)
+    return {"run_id": run_id, "pdf_path": pdf_path, "report_dir": report_dir}
+
+
+def prune_runs(keep: int = RUNS_KEEP, runs_dir: str = RUNS_DIR) -> None:
+    """Deletes the least recently modified run workspaces beyond the `keep` newest."""
+    if keep <= 0:
+        return
+    try:
+        entries = [e for e in os.scandir(runs_dir) if e.is_dir()]
+    except OSError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
 
 
-# === STATE FLOW NODES ===
-# In a robust LangGraph flow, you would usually pass inputs into the first node.
-# Since your agent modules handle file I/O internally, we'll keep the calls but ensure
-# they write the output paths to the state for the merge step.
+def report_path(state: dict, default_path: str) -> str:
+    """Where a report goes for this run; the shared default path when the state has no workspace."""
+    report_dir = state.get("report_dir")
+    return os.path.join(report_dir, os.path.basename(default_path)) if report_dir else default_path
 
-def load_json_safe(path: str) -> dict:
-    """Helper to safely load JSON output files."""
+
+def progress_writer():
+    """
+    Forwards pipeline progress events to the graph's "custom" stream. A no-op when
+    the graph is not being streamed with that mode.
+    """
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Warning: Could not load JSON from {path}. Error: {e}")
-        return {}
+        return get_stream_writer()
+    except Exception:
+        return lambda event: None
 
 
+# === STATE FLOW NODES ===
+# Each pipeline receives its inputs from the state and returns its output into it;
+# the JSON reports under ./lib/reports are written asynchronously as a side-effect.
+
 def run_main_agent(state: dict) -> dict:
-    """Runs Main Agent and reads/saves the RFP summary to state."""
+    """Runs Main Agent and stores the RFP summary in state."""
     print("\n🚀 Running Main Agent...")
-    # This function is expected to run the agent and save the output to RFP_JSON_PATH
-    main_agent_pipeline()
-
-    # Load the output file and store its content in the state
-    rfp_output = load_json_safe(RFP_JSON_PATH)
-    state["rfp_summary"] = rfp_output
+    state["rfp_summary"] = main_agent_pipeline(
+        model=get_registry().main_llm,
+        pdf_path=state.get("pdf_path", PDF_PATH),
+        output_path=report_path(state, RFP_JSON_PATH),
+        on_progress=progress_writer(),
+        chunk_scorer=get_registry().chunk_scorer,
+    )
     return state
 
 
 def run_technical_agent(state: dict) -> dict:
-    """Runs Technical Agent and reads/saves the technical recommendations to state."""
+    """Runs Technical Agent on the RFP summary in state and stores its recommendations."""
     print("\n⚙️ Running Technical Agent...")
-    # This function is expected to run the agent and save the output to TECH_OUTPUT_PATH
-    technical_agent_pipeline()
-
-    # Load the output file and store its content in the state
-    tech_output = load_json_safe(TECH_OUTPUT_PATH)
-    state["technical_output"] = tech_output
+    registry = get_registry()
+    state["technical_output"] = technical_agent_pipeline(
+        llm=registry.technical_llm,
+        db=registry.oem_index,
+        rfp=state.get("rfp_summary", {}),
+        output_path=report_path(state, TECH_OUTPUT_PATH),
+    )
     return state
 
 
 def run_pricing_agent(state: dict) -> dict:
-    """Runs Pricing Agent and reads/saves the pricing output to state."""
-    print("\n💰 Running Pricing Agent (LLM-driven)...")
-    # This function is expected to run the agent and save the output to OUTPUT_PRICING_JSON
-    pricing_agent_llm_pipeline()
-
-    # Load the output file and store its content in the state
-    price_output = load_json_safe(OUTPUT_PRICING_JSON)
-    state["pricing_output"] = price_output
+    """Runs Pricing Agent on the technical output in state and stores the quote."""
+    print(f"\n💰 Running Pricing Agent ({PRICING_MODE})...")
+    registry = get_registry()
+    if PRICING_MODE == "llm":
+        price_output = pricing_agent_llm_pipeline(
+            llm=registry.pricing_llm,
+            product_prices=registry.product_prices,
+            service_prices=registry.service_prices,
+            tech=state.get("technical_output", {}),
+            rfp=state.get("rfp_summary", {}),
+            output_path=report_path(state, OUTPUT_PRICING_JSON),
+        )
+    else:
+        price_output = pricing_agent_pipeline(
+            price_book=registry.price_book,
+            tech=state.get("technical_output", {}),
+            rfp=state.get("rfp_summary", {}),
+            output_path=report_path(state, OUTPUT_PRICING_JSON),
+        )
+    state["pricing_output"] = price_output or {}
     return state
 
 
 def merge_results(state: dict) -> dict:
-    """Consolidates results from state and saves the final JSON response."""
+    """Consolidates results from state into the final JSON response."""
     print("\n📦 Consolidating Final Output...")
 
     # Extract data directly from the state dictionary
-    rfp_summary = state.get("rfp_summary", {})
-    technical_output = state.get("technical_output", {})
-    pricing_output = state.get("pricing_output", {})
+    state["final_response"] = build_final_response(
+        state.get("rfp_summary", {}),
+        state.get("technical_output", {}),
+        state.get("pricing_output", {}),
+        output_path=report_path(state, FINAL_RESPONSE_PATH),
+    )
+    return state
 
+
+def build_final_response(rfp_summary: dict, technical_output: dict, pricing_output: dict,
+                         output_path: str = FINAL_RESPONSE_PATH) -> dict:
     # Safely construct the final response structure
     final_response = {
         "RFP_Metadata": rfp_summary.get("RFP_Metadata", {}),
@@ -83,11 +175,109 @@ def merge_results(state: dict) -> dict:
         "Grand_Total_INR": pricing_output.get("Grand_Total_INR", 0)
     }
 
-    with open(FINAL_RESPONSE_PATH, "w", encoding="utf-8") as f:
-        json.dump(final_response, f, indent=2, ensure_ascii=False)
+    persist_json(output_path, final_response)
+    print(f"✅ Final RFP Response ready (saving to {output_path})")
+    return final_response
+
+
+# === PARALLEL (FAN-OUT) FLOW NODES ===
+# Nodes return partial state updates; `product_results` is merged by its reducer.
+
+def run_main_agent_branch(state: RFPState) -> dict:
+    """Extracts the RFP summary (runs concurrently with catalog loading)."""
+    return {"rfp_summary": main_agent_pipeline(
+        model=get_registry().main_llm,
+        pdf_path=state.get("pdf_path", PDF_PATH),
+        output_path=report_path(state, RFP_JSON_PATH),
+        on_progress=progress_writer(),
+        chunk_scorer=get_registry().chunk_scorer,
+    )}
+
+
+def load_catalog(state: RFPState) -> dict:
+    """Warms the embedding model, OEM index and price book while the PDF is processed."""
+    print("\n📚 Loading OEM catalog and price tables...")
+    registry = get_registry()
+    # Accessing a registry property builds (or reuses) that component.
+    registry.oem_index
+    registry.price_book
+    registry.technical_llm
+    if PRICING_MODE == "llm":
+        registry.pricing_llm
+    return {"catalog_ready": True}
+
+
+def products_in_scope(state: RFPState) -> List[str]:
+    """Products_In_Scope of the extracted RFP summary."""
+    return state.get("rfp_summary", {}).get("Technical_Summary", {}).get("Products_In_Scope", [])
+
+
+def plan_products(state: RFPState) -> dict:
+    """Join point for the main agent and catalog branches; retrieves matches for all products in one batch."""
+    products = products_in_scope(state)
+    if not products:
+        return {"product_matches": []}
+    print(f"\n🔎 Searching the OEM catalog for {len(products)} product(s)...")
+    return {"product_matches": find_top_matches_batch(get_registry().oem_index, products, top_k=5)}
+
+
+def fan_out_products(state: RFPState):
+    """One Send (with that product's matches) per Products_In_Scope item; straight to the merge when there are none."""
+    products = products_in_scope(state)
+    if not products:
+        return "Merge_Output"
+    print(f"\n🔀 Fanning out {len(products)} product(s)...")
+    rfp_summary = state.get("rfp_summary", {})
+    return [
+        Send("Product_Agent", {"index": i, "product": product, "matches": matches, "rfp_summary": rfp_summary})
+        for i, (product, matches) in enumerate(zip(products, state.get("product_matches", [])))
+    ]
 
-    print(f"✅ Final RFP Response Saved: {FINAL_RESPONSE_PATH}")
-    return state
+
+def run_product_agent(task: ProductTask) -> dict:
+    """Technical recommendation + pricing (PRICING_MODE=engine) for a single RFP product."""
+    registry = get_registry()
+    product = task["product"]
+    print(f"Processing RFP Requirement: {product}")
+
+    # Concurrency across products comes from the graph (GRAPH_MAX_CONCURRENCY).
+    chain = TECH_PROMPT | registry.technical_llm | StrOutputParser()
+    recommendation = recommend_products(chain, [product], [task["matches"]], max_concurrency=1)[0]
+
+    pricing = None
+    if PRICING_MODE != "llm":  # the LLM prices all products at once in Merge_Output
+        price_book = registry.price_book
+        pricing = price_recommendation(recommendation, price_book, price_book.services_for(task["rfp_summary"]))
+    return {"product_results": [{"index": task["index"], "technical": recommendation, "pricing": pricing}]}
+
+
+def merge_product_results(state: RFPState) -> dict:
+    """Orders the per-product branch results, prices them in one call if PRICING_MODE=llm, and writes the final response."""
+    print("\n📦 Consolidating Final Output...")
+    ordered = sorted(state.get("product_results", []), key=lambda r: r["index"])
+
+    technical_output = {"RFP_Technical_Recommendations": [r["technical"] for r in ordered]}
+    persist_json(report_path(state, TECH_OUTPUT_PATH), technical_output)
+    if PRICING_MODE == "llm":
+        print("\n💰 Running Pricing Agent (llm)...")
+        registry = get_registry()
+        pricing_output = pricing_agent_llm_pipeline(
+            llm=registry.pricing_llm,
+            product_prices=registry.product_prices,
+            service_prices=registry.service_prices,
+            tech=technical_output,
+            rfp=state.get("rfp_summary", {}),
+            output_path=report_path(state, OUTPUT_PRICING_JSON),
+        ) or {}
+    else:
+        pricing_summary = [r["pricing"] for r in ordered]
+        pricing_output = {"Pricing_Summary": pricing_summary, "Grand_Total_INR": grand_total(pricing_summary)}
+        persist_json(report_path(state, OUTPUT_PRICING_JSON), pricing_output)
+    final_response = build_final_response(
+        state.get("rfp_summary", {}), technical_output, pricing_output,
+        output_path=report_path(state, FINAL_RESPONSE_PATH),
+    )
+    return {"technical_output": technical_output, "pricing_output": pricing_output, "final_response": final_response}
 
 
 ## 🏗️ Graph Definition
@@ -112,18 +302,79 @@ def build_orchestral_flow():
     return workflow
 
 
+def build_parallel_flow():
+    """
+    Fan-out variant: PDF extraction and catalog loading start together, then every
+    product gets its own technical + pricing branch, joined again at Merge_Output.
+    """
+    workflow = StateGraph(RFPState)
+
+    workflow.add_node("Main_Agent", run_main_agent_branch)
+    workflow.add_node("Load_Catalog", load_catalog)
+    workflow.add_node("Plan_Products", plan_products)
+    workflow.add_node("Product_Agent", run_product_agent)
+    workflow.add_node("Merge_Output", merge_product_results)
+
+    workflow.add_edge(START, "Main_Agent")
+    workflow.add_edge(START, "Load_Catalog")
+    workflow.add_edge(["Main_Agent", "Load_Catalog"], "Plan_Products")
+    workflow.add_conditional_edges("Plan_Products", fan_out_products, ["Product_Agent", "Merge_Output"])
+    workflow.add_edge("Product_Agent", "Merge_Output")
+    workflow.add_edge("Merge_Output", END)
+
+    return workflow
+
+
+def compile_graph():
+    """Compiles the configured graph variant."""
+    workflow = build_parallel_flow() if GRAPH_VARIANT == "parallel" else build_orchestral_flow()
+    return workflow.compile().with_config(max_concurrency=GRAPH_MAX_CONCURRENCY)
+
+
+# === STREAMING ===
+def _node_payload(node: str, update: Any) -> Dict[str, Any]:
+    """The user-facing part of a node's state update (partial results as soon as they exist)."""
+    if not isinstance(update, dict):
+        return {}
+    payload = {}
+    if node == "Main_Agent" and "rfp_summary" in update:
+        payload["RFP_Metadata"] = update["rfp_summary"].get("RFP_Metadata", {})
+        payload["Technical_Summary"] = update["rfp_summary"].get("Technical_Summary", {})
+    elif node == "Technical_Agent" and "technical_output" in update:
+        payload["technical_output"] = update["technical_output"]
+    elif node == "Pricing_Agent" and "pricing_output" in update:
+        payload["pricing_output"] = update["pricing_output"]
+    elif node == "Product_Agent":
+        payload["product_results"] = update.get("product_results", [])
+    if node == "Merge_Output" and "final_response" in update:
+        payload["final_response"] = update["final_response"]
+    return payload
+
+
+def iter_workflow_events(executor, state: dict):
+    """
+    Runs the workflow and yields progress events: pipeline events (e.g. each map
+    chunk) as they happen and a "node_completed" event with partial results after
+    every node.
+    """
+    for mode, chunk in executor.stream(state, stream_mode=["updates", "custom"]):
+        if mode == "custom":
+            yield chunk
+            continue
+        for node, update in chunk.items():
+            yield {"event": "node_completed", "node": node, **_node_payload(node, update)}
+
+
 # === ENTRY POINT ===
 if __name__ == "__main__":
-    import os
-
     print("Current working directory:", os.getcwd())
     print("\n🎯 Starting LangGraph Orchestral Flow...")
 
-    graph = build_orchestral_flow()
-    executor = graph.compile()
+    executor = get_registry().graph
 
     # The executor's input is an empty dictionary for the initial state
     final_state = executor.invoke({})
+    flush_reports()
     print("\n🏁 Workflow completed successfully.")
     # Optional: Print the final state contents
     # print("\nFinal State Keys:", final_state.keys())
@@ -0,0 +1,112 @@
+"""
+job_queue.py
+
+In-process job queue for long-running agent workflows.
+
+Jobs are executed by a bounded thread pool, off the FastAPI event loop. Each job
+tracks its status (queued -> running -> succeeded/failed), a free-form progress
+dict the runner can update while it works, and the result or error. Only the
+most recent finished jobs are kept in memory.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Job statuses
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, payload: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = JOB_STATUS_QUEUED
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update_progress(self, **changes: Any) -> None:
+        with self._lock:
+            self.progress.update(changes)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED)
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """Runs `runner(job)` for every submitted job on at most `max_workers` threads."""
+
+    def __init__(self, runner: Callable[[Job], Any], max_workers: int = 2,
+                 max_queued: int = 50, history_limit: int = 200):
+        self.runner = runner
+        self.max_queued = max_queued
+        self.history_limit = history_limit
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="agent-job")
+
+    def submit(self, payload: Dict[str, Any]) -> Job:
+        job = Job(payload)
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.status == JOB_STATUS_QUEUED)
+            if queued >= self.max_queued:
+                raise QueueFullError(f"{queued} jobs are already queued; try again later.")
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job) -> None:
+        job.status = JOB_STATUS_RUNNING
+        job.started_at = time.time()
+        try:
+            result, error, status = self.runner(job), None, JOB_STATUS_SUCCEEDED
+        except Exception as e:
+            result, error, status = None, str(e), JOB_STATUS_FAILED
+        # finished_at is set before the status, so a finished job always has one (see _prune).
+        job.result, job.error = result, error
+        job.finished_at = time.time()
+        job.status = status
+
+    def _prune(self) -> None:
+        """Forgets the oldest finished jobs beyond history_limit (caller holds the lock)."""
+        finished = sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.finished_at)
+        for job in finished[:max(0, len(finished) - self.history_limit)]:
+            del self._jobs[job.id]
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
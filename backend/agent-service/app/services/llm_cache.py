@@ -0,0 +1,244 @@
+"""
+llm_cache.py
+
+Persistent, content-addressed cache for LLM responses shared by all agent modules.
+
+Responses are stored in a local SQLite file and keyed by
+(model repo_id, temperature, max_new_tokens, hash of the rendered prompt), so
+re-running an unchanged RFP is served from disk without touching the endpoint.
+Every agent prompt asks for JSON, so only responses that parse as JSON (after
+stripping ``` fences) are stored; a malformed answer is retried on the next run.
+Entries expire after LLM_CACHE_TTL_S seconds and the least recently used entries
+are evicted once the cache holds more than LLM_CACHE_MAX_ENTRIES rows.
+
+Map-stage outputs per chunk (ChunkOutputCache) live in a separate store with their
+own, much longer, lifetime: a corrigendum can come out weeks after the original RFP.
+
+Usage:
+    ChatHuggingFace(llm=endpoint, cache=get_llm_cache(repo_id, temperature, max_new_tokens))
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+# CONFIG
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./lib/cache/llm_cache.sqlite3")
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Per-chunk map outputs (ChunkOutputCache). Also off when LLM_CACHE_ENABLED=0.
+MAP_OUTPUT_CACHE_ENABLED = os.getenv("MAP_OUTPUT_CACHE_ENABLED", "1") != "0"
+MAP_OUTPUT_CACHE_PATH = os.getenv("MAP_OUTPUT_CACHE_PATH", "./lib/cache/map_outputs.sqlite3")
+MAP_OUTPUT_CACHE_TTL_S = float(os.getenv("MAP_OUTPUT_CACHE_TTL_S", str(180 * 24 * 3600)))
+MAP_OUTPUT_CACHE_MAX_ENTRIES = int(os.getenv("MAP_OUTPUT_CACHE_MAX_ENTRIES", "50000"))
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_json_response(text: str) -> bool:
+    """True when `text` parses as JSON once Markdown code fences are stripped."""
+    try:
+        json.loads(text.replace("```json", "").replace("```", "").strip())
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+class ResponseStore:
+    """SQLite-backed key/value store with TTL + LRU eviction and hit/miss counters."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_s: float = LLM_CACHE_TTL_S,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One shared connection; every access goes through self._lock.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " namespace TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_s > 0 and row[1] < now - self.ttl_s):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, namespace: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, value, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, value, now, now),
+            )
+            self._conn.commit()
+            self._writes_since_evict += 1
+            should_evict = self._writes_since_evict >= 50
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drops expired rows, then the least recently used rows above max_entries."""
+        with self._lock:
+            if self.ttl_s > 0:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_s,))
+            if self.max_entries > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+            self._writes_since_evict = 0
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM responses")
+            else:
+                self._conn.execute("DELETE FROM responses WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"path": self.path, "entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+class ResponseCache(BaseCache):
+    """LangChain cache view over a ResponseStore, bound to one model configuration."""
+
+    def __init__(self, store: ResponseStore, repo_id: str, temperature: float, max_new_tokens: int):
+        self.store = store
+        self.namespace = json.dumps([repo_id, temperature, max_new_tokens])
+
+    def _key(self, prompt: str) -> str:
+        # llm_string is deliberately not part of the key: the model configuration
+        # that matters is captured by the namespace, and the prompt by its hash.
+        return sha256_text(self.namespace + "\n" + sha256_text(prompt))
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        value = self.store.get(self._key(prompt))
+        if value is None:
+            return None
+        generations = []
+        for item in json.loads(value):
+            if item.get("chat"):
+                generations.append(ChatGeneration(message=AIMessage(content=item["text"])))
+            else:
+                generations.append(Generation(text=item["text"]))
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if not return_val or not all(is_json_response(gen.text) for gen in return_val):
+            return
+        value = json.dumps([
+            {"text": gen.text, "chat": isinstance(gen, ChatGeneration)} for gen in return_val
+        ], ensure_ascii=False)
+        self.store.put(self._key(prompt), self.namespace, value)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear(self.namespace)
+
+
+class ChunkOutputCache:
+    """
+    Map-stage outputs keyed by the content hash of the chunk they were extracted from,
+    within a namespace for the model configuration and prompt. Unchanged chunks of a
+    revised RFP are answered from here without building the prompt or calling the LLM.
+    """
+
+    def __init__(self, store: ResponseStore, namespace_parts: Sequence[Any]):
+        self.store = store
+        self.namespace = "chunk:" + json.dumps(list(namespace_parts))
+
+    def _key(self, chunk_text: str) -> str:
+        return sha256_text(self.namespace + "\n" + sha256_text(chunk_text))
+
+    def get(self, chunk_text: str) -> Optional[str]:
+        return self.store.get(self._key(chunk_text))
+
+    def put(self, chunk_text: str, output: str) -> None:
+        self.store.put(self._key(chunk_text), self.namespace, output)
+
+
+_store: Optional[ResponseStore] = None
+_chunk_store: Optional[ResponseStore] = None
+_store_lock = threading.Lock()
+
+
+def get_response_store() -> ResponseStore:
+    """Process-wide store, opened on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResponseStore()
+        return _store
+
+
+def get_chunk_output_store() -> ResponseStore:
+    """Process-wide store for per-chunk map outputs, opened on first use."""
+    global _chunk_store
+    with _store_lock:
+        if _chunk_store is None:
+            _chunk_store = ResponseStore(MAP_OUTPUT_CACHE_PATH, MAP_OUTPUT_CACHE_TTL_S, MAP_OUTPUT_CACHE_MAX_ENTRIES)
+        return _chunk_store
+
+
+def get_llm_cache(repo_id: str, temperature: float, max_new_tokens: int) -> Optional[ResponseCache]:
+    """Cache for one model configuration, or None when LLM_CACHE_ENABLED=0."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    return ResponseCache(get_response_store(), repo_id, temperature, max_new_tokens)
+
+
+def get_chunk_output_cache(*namespace_parts: Any) -> Optional[ChunkOutputCache]:
+    """Per-chunk map output cache for one model + prompt, or None when it (or the LLM cache) is disabled."""
+    if not (LLM_CACHE_ENABLED and MAP_OUTPUT_CACHE_ENABLED):
+        return None
+    return ChunkOutputCache(get_chunk_output_store(), namespace_parts)
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Entries and hit/miss counts of the LLM response cache and the per-chunk map output cache."""
+    if not LLM_CACHE_ENABLED:
+        return {"enabled": False}
+    stats = {"enabled": True, **get_response_store().stats()}
+    if MAP_OUTPUT_CACHE_ENABLED:
+        stats["map_outputs"] = get_chunk_output_store().stats()
+    return stats
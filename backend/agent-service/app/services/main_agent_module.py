@@ -2,17 +2,58 @@ import os
 import re
 import json
 import time
-from typing import Dict, Any, List, Tuple
+import queue
+import threading
+from copy import deepcopy
+from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Tuple, Iterable, Iterator, Optional, Callable
 from dotenv import load_dotenv
 from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from llm_cache import get_llm_cache, get_chunk_output_cache, sha256_text
+from pdf_text import extract_pages, iter_pages
+from chunking import estimate_tokens, count_tokens, iter_token_chunks, iter_content_defined_chunks
+from relevance import ChunkScorer, filter_chunks, RELEVANCE_FILTER, RELEVANCE_THRESHOLD
+from report_store import persist_json, flush as flush_reports
+
 ##Config
 PDF_PATH ="Nit_jsr.pdf"
-OUTPUT_JSON_PATH = ".lib/reports/rfp_summary.json"
+OUTPUT_JSON_PATH = "./lib/reports/rfp_summary.json"
+
+# Map phase: max chunk calls in flight against the endpoint, and how long a
+# single call may take before its fragment is dropped.
+MAP_MAX_CONCURRENCY = int(os.getenv("MAP_MAX_CONCURRENCY", "4"))
+MAP_CALL_TIMEOUT_S = float(os.getenv("MAP_CALL_TIMEOUT_S", "180"))
+# Map chunking: "cdc" cuts chunks at content-defined anchors (headings and hashed
+# lines) so a revised RFP re-uses the map outputs of its unchanged chunks; "tokens"
+# packs chunks along section headings up to the token budget; "chars" uses the fixed
+# 4000/400 character splitter. Token sizes are measured with the model's tokenizer.
+# The budget is MAP_CHUNK_TOKENS, capped by what the model's context
+# (MAP_CONTEXT_TOKENS) leaves after the prompt and the reserved output tokens.
+MAP_CHUNKING = os.getenv("MAP_CHUNKING", "cdc")
+MAP_CHUNK_TOKENS = int(os.getenv("MAP_CHUNK_TOKENS", "6000"))
+MAP_CONTEXT_TOKENS = int(os.getenv("MAP_CONTEXT_TOKENS", "32768"))
+MAX_NEW_TOKENS = 2000
+# Chat template markup around the prompt (role headers, special tokens).
+CHAT_TEMPLATE_TOKENS = 64
+# Chunks extracted ahead of the map stage. PDF parsing and chunking run on a
+# background thread and block once this many chunks are waiting for a free slot.
+MAP_PREFETCH_CHUNKS = 2 * MAP_MAX_CONCURRENCY
+# How often invoke_json_bounded checks for a new prefetched input while calls are in flight.
+INPUT_POLL_S = 0.05
+
+# Reduce phase: "local" unions list fields in Python and only asks the LLM about
+# conflicting scalar fields; "tree" merges fragments in groups sized to fit
+# REDUCE_TOKEN_BUDGET (prompt input tokens) before the final merge; "single" sends
+# every fragment at once.
+REDUCE_MODE = os.getenv("REDUCE_MODE", "local")
+REDUCE_TOKEN_BUDGET = int(os.getenv("REDUCE_TOKEN_BUDGET", "6000"))
+# Two normalized strings at least this similar are treated as the same entry.
+NEAR_DUPLICATE_RATIO = 0.9
 
 def llm_model():
     load_dotenv()
@@ -24,25 +65,167 @@ def llm_model():
         repo_id="Qwen/Qwen2.5-Coder-32B-Instruct",
         task="text-generation",
         huggingfacehub_api_token=os.getenv("HUGGINGFACEHUB_API_TOKEN"),
-        max_new_tokens=2000,
+        max_new_tokens=MAX_NEW_TOKENS,
         temperature=0.3,
     )
 
-    return ChatHuggingFace(llm=llm)
+    return ChatHuggingFace(llm=llm, cache=get_llm_cache(llm.repo_id, llm.temperature, llm.max_new_tokens))
 
 def read_pdf_text(pdf_path: str) -> str:
-    loader = PyPDFLoader(pdf_path)
-    docs = loader.load()
-    return "\n\n".join(d.page_content for d in docs)
+    return "\n\n".join(extract_pages(pdf_path))
 
 
-def split_into_chunks(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-    splitter = RecursiveCharacterTextSplitter(
+def _chunk_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", " ", ""],
     )
-    return splitter.split_text(text)
+
+
+def split_into_chunks(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    return _chunk_splitter(chunk_size, chunk_overlap).split_text(text)
+
+
+def iter_chunks(pages: Iterable[str], chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """
+    Splits a stream of pages with the split_into_chunks splitter. Text is only buffered
+    until it forms complete chunks; the last (possibly unfinished) chunk is carried over
+    and re-split together with the next page. Chunk size and overlap limits are the same
+    as split_into_chunks on the joined text, but boundaries near the carried-over chunk
+    can differ from it.
+    """
+    splitter = _chunk_splitter(chunk_size, chunk_overlap)
+    buffer = ""
+    for page in pages:
+        buffer = f"{buffer}\n\n{page}" if buffer else page
+        if len(buffer) < 2 * chunk_size:
+            continue
+        chunks = splitter.split_text(buffer)
+        yield from chunks[:-1]
+        buffer = chunks[-1] if chunks else ""
+    if buffer:
+        yield from splitter.split_text(buffer)
+
+
+def map_chunk_budget() -> int:
+    """Tokens of chunk text that fit one map call next to CHUNK_MAP_PROMPT and its output."""
+    prompt_tokens = count_tokens(CHUNK_MAP_PROMPT.format(chunk_text=""))
+    available = MAP_CONTEXT_TOKENS - prompt_tokens - MAX_NEW_TOKENS - CHAT_TEMPLATE_TOKENS
+    return max(256, min(MAP_CHUNK_TOKENS, available))
+
+
+def iter_map_chunks(pages: Iterable[str]) -> Iterator[str]:
+    """Chunks for the map stage, per MAP_CHUNKING."""
+    if MAP_CHUNKING == "chars":
+        return iter_chunks(pages, chunk_size=4000, chunk_overlap=400)
+    if MAP_CHUNKING == "tokens":
+        return iter_token_chunks(pages, map_chunk_budget())
+    return iter_content_defined_chunks(pages, map_chunk_budget())
+
+
+def model_signature(model) -> List[Any]:
+    """Identifies the model configuration behind a chat model (repo, temperature, output limit)."""
+    endpoint = getattr(model, "llm", model)
+    return [
+        getattr(endpoint, "repo_id", type(model).__name__),
+        getattr(endpoint, "temperature", None),
+        getattr(endpoint, "max_new_tokens", None),
+    ]
+
+
+class CachedMapChain:
+    """
+    Wraps the map chain so chunks already extracted with the same model and prompt are
+    served from a ChunkOutputCache. Only valid JSON outputs are stored.
+    """
+
+    def __init__(self, chain, cache):
+        self.chain = chain
+        self.cache = cache
+        self.reused = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, payload: Dict[str, Any]) -> str:
+        chunk_text = payload["chunk_text"]
+        if self.cache is not None:
+            cached = self.cache.get(chunk_text)
+            if cached is not None:
+                with self._lock:
+                    self.reused += 1
+                return cached
+
+        output = self.chain.invoke(payload)
+        if self.cache is not None:
+            try:
+                json.loads(output)
+            except json.JSONDecodeError:
+                return output
+            self.cache.put(chunk_text, output)
+        return output
+
+
+class Prefetch:
+    """
+    Iterates `items` on a background thread, staying at most `buffer_size` items ahead
+    of the consumer, so producing the next item overlaps with consuming this one.
+    Exceptions raised by the producer are re-raised to the consumer. Besides plain
+    iteration, `get(timeout)` lets the consumer wait for the next item with a timeout.
+    """
+
+    _END = object()
+
+    def __init__(self, items: Iterable[Any], buffer_size: int):
+        self._buffer: queue.Queue = queue.Queue(maxsize=max(1, buffer_size))
+        self._stopped = threading.Event()
+        self._finished = False
+        self._producer = threading.Thread(target=self._produce, args=(items,), name="prefetch", daemon=True)
+        self._producer.start()
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, items: Iterable[Any]):
+        try:
+            for item in items:
+                if not self._put((item, None)):
+                    return
+            self._put((self._END, None))
+        except BaseException as e:
+            self._put((self._END, e))
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """The next item. Raises StopIteration at the end, queue.Empty if none is ready within `timeout`."""
+        if self._finished:
+            raise StopIteration
+        item, error = self._buffer.get(timeout=timeout)
+        if item is self._END:
+            self._finished = True
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def __iter__(self) -> "Prefetch":
+        return self
+
+    def __next__(self) -> Any:
+        return self.get()
+
+    def close(self) -> None:
+        """Lets the producer exit if the consumer stops early."""
+        self._stopped.set()
+
+
+def prefetch(items: Iterable[Any], buffer_size: int) -> Prefetch:
+    return Prefetch(items, buffer_size)
+
 
 CHUNK_MAP_PROMPT = PromptTemplate(
     template=(
@@ -75,6 +258,19 @@ REDUCE_PROMPT = PromptTemplate(
     ),
     input_variables=["schema", "partials_json"],
 )
+CONFLICT_PROMPT = PromptTemplate(
+    template=(
+        "You are resolving conflicting values extracted from different chunks of the same RFP.\n"
+        "For each field below you get the candidate values. Pick the most complete/precise one, or combine them "
+        "into one concise value if they describe different parts of the same thing (e.g. a Summary).\n\n"
+        "Rules:\n"
+        "- Output ONLY a valid JSON object mapping each field name to a single string (no comments, no backticks).\n"
+        "- Do NOT invent facts that are not in the candidates.\n\n"
+        "CONFLICTS (field -> candidates):\n{conflicts_json}\n"
+    ),
+    input_variables=["conflicts_json"],
+)
+
 EXPECTED_SCHEMA_EXAMPLE = {
     "RFP_Metadata": {
         "Title": "Supply, Installation, and Testing of Network Equipment for ABC Industries",
@@ -110,35 +306,366 @@ EXPECTED_SCHEMA_EXAMPLE = {
     }
 }
 
+# ==== BOUNDED CONCURRENT INVOCATION ====
+def invoke_json_bounded(
+    chain,
+    inputs: Iterable[Dict[str, Any]],
+    max_concurrency: int = MAP_MAX_CONCURRENCY,
+    call_timeout: float = MAP_CALL_TIMEOUT_S,
+    label: str = "Chunk",
+    on_result: Optional[Callable[[int, Optional[Dict[str, Any]]], None]] = None,
+    prefetch_size: int = 0,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Runs `chain.invoke` for every input with at most `max_concurrency` calls in flight
+    and returns the parsed JSON results in input order. Calls that fail, time out or
+    return invalid JSON yield None in their slot. `on_result(index, result)` is called
+    from the calling thread as each call settles.
+
+    With `prefetch_size`, inputs are produced on a background thread (see Prefetch) up
+    to that many ahead, and slow inputs (e.g. a PDF still being parsed) never hold up
+    collecting finished calls or enforcing their timeouts.
+    """
+    results: Dict[int, Optional[Dict[str, Any]]] = {}
+    pending = {}  # future -> (index, deadline)
+    source = prefetch(inputs, prefetch_size) if prefetch_size else None
+    inputs_iter = iter(inputs) if source is None else None
+    submitted = 0
+    exhausted = False
+
+    def submit_next(pool) -> bool:
+        """Submits the next input if one is ready; sets `exhausted` at the end of the inputs."""
+        nonlocal submitted, exhausted
+        try:
+            if source is None:
+                payload = next(inputs_iter)
+            else:
+                # Only block on the inputs while there is nothing in flight to look after.
+                payload = source.get(timeout=INPUT_POLL_S if pending else None)
+        except StopIteration:
+            exhausted = True
+            return False
+        except queue.Empty:
+            return False
+        future = pool.submit(chain.invoke, payload)
+        pending[future] = (submitted, time.monotonic() + call_timeout)
+        submitted += 1
+        return True
+
+    # Spare workers keep abandoned (timed-out) calls from starving the window.
+    pool = ThreadPoolExecutor(max_workers=2 * max(1, max_concurrency))
+    try:
+        # Sliding window: a call is only submitted when a worker is free, so its
+        # deadline measures the call itself rather than time spent queued.
+        while not exhausted or pending:
+            while not exhausted and len(pending) < max(1, max_concurrency):
+                if not submit_next(pool):
+                    break
+
+            if not pending:
+                continue
+
+            next_deadline = min(deadline for _, deadline in pending.values())
+            timeout = max(0.0, next_deadline - time.monotonic())
+            if not exhausted and len(pending) < max(1, max_concurrency):
+                timeout = min(timeout, INPUT_POLL_S)  # check again for a new input soon
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                idx, _ = pending.pop(future)
+                try:
+                    results[idx] = json.loads(future.result())
+                except json.JSONDecodeError:
+                    print(f"⚠️ {label} {idx + 1} produced invalid JSON, skipping.")
+                    results[idx] = None
+                except Exception as e:
+                    print(f"⚠️ {label} {idx + 1} failed ({e}), skipping.")
+                    results[idx] = None
+                print(f"Processed {label.lower()} {idx + 1} ({len(results)} done)...")
+                if on_result:
+                    on_result(idx, results[idx])
+
+            now = time.monotonic()
+            for future, (idx, deadline) in list(pending.items()):
+                if not future.done() and deadline <= now:
+                    # The worker thread cannot be interrupted; we stop waiting on it
+                    # and let it finish in the background.
+                    print(f"⚠️ {label} {idx + 1} timed out after {call_timeout}s, skipping.")
+                    pending.pop(future)
+                    results[idx] = None
+                    if on_result:
+                        on_result(idx, None)
+    finally:
+        if source is not None:
+            source.close()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return [results[i] for i in sorted(results)]
+
+
+# ==== REDUCE ====
+def reduce_group_size(fragments: List[Dict[str, Any]], overhead_tokens: int,
+                      token_budget: int = REDUCE_TOKEN_BUDGET) -> int:
+    """How many fragments fit into one reduce prompt, given the average fragment size."""
+    sizes = [estimate_tokens(json.dumps(f, indent=2)) for f in fragments]
+    avg_size = sum(sizes) / max(len(sizes), 1)
+    available = max(token_budget - overhead_tokens, 1)
+    return max(2, int(available // max(avg_size, 1)))
+
+
+def tree_reduce(reduce_chain, fragments: List[Dict[str, Any]], schema_str: str,
+                token_budget: int = REDUCE_TOKEN_BUDGET) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Merges fragments level by level in parallel groups until they fit into a single
+    reduce prompt. Returns the remaining fragments and whether they are already
+    merged (schema-shaped) results.
+    """
+    overhead_tokens = estimate_tokens(REDUCE_PROMPT.template + schema_str)
+    merged = False
+    level = 0
+
+    while len(fragments) > 1:
+        payload_tokens = estimate_tokens(json.dumps(fragments, indent=2))
+        if overhead_tokens + payload_tokens <= token_budget:
+            break
+
+        group_size = reduce_group_size(fragments, overhead_tokens, token_budget)
+        if group_size >= len(fragments):
+            break
+        groups = [fragments[i:i + group_size] for i in range(0, len(fragments), group_size)]
+
+        level += 1
+        print(f"Reduce level {level}: merging {len(fragments)} fragments in {len(groups)} groups of <= {group_size}...")
+        group_results = invoke_json_bounded(
+            reduce_chain,
+            ({"schema": schema_str, "partials_json": json.dumps(group, indent=2)} for group in groups),
+            label="Reduce group",
+        )
+
+        next_fragments = []
+        for group, result in zip(groups, group_results):
+            # Keep the raw fragments of a failed group so nothing is lost.
+            next_fragments.extend([result] if result is not None else group)
+
+        if len(next_fragments) >= len(fragments):
+            print("⚠️ Reduce level made no progress, falling back to a single merge.")
+            break
+        fragments = next_fragments
+        merged = all(result is not None for result in group_results)
+
+    return fragments, merged
+
+
+# ==== LOCAL PRE-MERGE ====
+def _normalize_text(value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    value = re.sub(r"\s+", " ", value).strip().lower()
+    return value.strip(" .,;:-")
+
+
+def _is_near_duplicate(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    # "10 sq mm" vs "16 sq mm", "24-port" vs "48-port": different line items, however similar.
+    if re.findall(r"\d+(?:\.\d+)?", a) != re.findall(r"\d+(?:\.\d+)?", b):
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= NEAR_DUPLICATE_RATIO
+
+
+def dedupe_values(values: List[Any]) -> List[Any]:
+    """
+    Case/whitespace-insensitive, near-duplicate aware dedupe that keeps first-seen
+    order. Values whose numbers differ are never merged. When two entries collide
+    the longer (more complete) phrasing wins.
+    """
+    kept: List[Any] = []
+    keys: List[str] = []
+    for value in values:
+        key = _normalize_text(value)
+        if not key:
+            continue
+        for i, existing in enumerate(keys):
+            if _is_near_duplicate(key, existing):
+                if len(key) > len(existing):
+                    kept[i], keys[i] = value, key
+                break
+        else:
+            kept.append(value)
+            keys.append(key)
+    return kept
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def premerge_fragments(fragments: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """
+    Deterministically merges partial fragments against EXPECTED_SCHEMA_EXAMPLE.
+    List fields are unioned and deduped; scalar fields with a single distinct value
+    are taken as-is. Returns the merged JSON and the scalar fields ("Section.Field")
+    that still have conflicting candidates.
+    """
+    merged: Dict[str, Any] = {}
+    conflicts: Dict[str, List[str]] = {}
+
+    for section, fields in EXPECTED_SCHEMA_EXAMPLE.items():
+        merged[section] = {}
+        for field, example in fields.items():
+            values: List[Any] = []
+            for fragment in fragments:
+                if not isinstance(fragment, dict):
+                    continue
+                container = fragment.get(section)
+                # Map outputs are sometimes flat, so accept top-level keys as well.
+                value = container.get(field) if isinstance(container, dict) else fragment.get(field)
+                values.extend(_as_list(value))
+
+            candidates = dedupe_values(values)
+            if isinstance(example, list):
+                merged[section][field] = candidates
+                continue
+
+            candidates = [c if isinstance(c, str) else json.dumps(c, ensure_ascii=False) for c in candidates]
+            merged[section][field] = candidates[0] if len(candidates) == 1 else ""
+            if len(candidates) > 1:
+                conflicts[f"{section}.{field}"] = candidates
+
+    return merged, conflicts
+
+
+def resolve_conflicts(conflict_chain, merged: Dict[str, Any], conflicts: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Asks the LLM to settle conflicting scalar fields; falls back to the longest candidate."""
+    resolved: Dict[str, Any] = {}
+    if conflicts:
+        print(f"Resolving {len(conflicts)} conflicting field(s) with the LLM...")
+        try:
+            response = conflict_chain.invoke({"conflicts_json": json.dumps(conflicts, indent=2, ensure_ascii=False)})
+            resolved = json.loads(response)
+        except Exception as e:
+            print(f"⚠️ Conflict resolution failed ({e}), keeping the most complete candidates.")
+
+    result = deepcopy(merged)
+    for path, candidates in conflicts.items():
+        section, field = path.split(".", 1)
+        value = resolved.get(path) if isinstance(resolved, dict) else None
+        if not isinstance(value, str) or not value.strip():
+            value = max(candidates, key=len)
+        result[section][field] = value
+    return result
+
+
 # ==== MAIN AGENT PIPELINE ====
-def main_agent_pipeline() -> Dict[str, Any]:
+def main_agent_pipeline(model=None, pdf_path: str = PDF_PATH, output_path: Optional[str] = OUTPUT_JSON_PATH,
+                        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        chunk_scorer: Optional[ChunkScorer] = None) -> Dict[str, Any]:
+    """
+    Returns the RFP summary; also saves it to `output_path` in the background unless that is None.
+    `on_progress` receives an event dict for every finished chunk and when merging starts.
+    Chunks that `chunk_scorer` rates as boilerplate are dropped or mapped last (see relevance.py);
+    without a scorer, chunks are scored by keywords only.
+    """
+    emit = on_progress or (lambda event: None)
     print("\n🚀 Running Main Agent...")
-    model = llm_model()
-    text = read_pdf_text(PDF_PATH)
-    chunks = split_into_chunks(text, chunk_size=4000, chunk_overlap=400)
+    model = model or llm_model()
+    # Unchanged chunks (e.g. of a corrigendum to an RFP seen before) skip the LLM
+    map_chain = CachedMapChain(
+        CHUNK_MAP_PROMPT | model | StrOutputParser(),
+        get_chunk_output_cache(*model_signature(model), sha256_text(CHUNK_MAP_PROMPT.template)),
+    )
 
-    map_chain = CHUNK_MAP_PROMPT | model | StrOutputParser()
-    partial_jsons = []
+    # Pages stream into the chunker and chunks go to the map stage as soon as they are
+    # complete, so the first LLM calls start while the rest of the PDF is still parsed.
+    chunks_seen = 0
+    chunks_total: Optional[int] = None
+    scorer = chunk_scorer or ChunkScorer()
+    filtered_chunks: List[Dict[str, Any]] = []
+    # Document position (1-based, before filtering) of each chunk sent to the map stage
+    chunk_numbers: List[int] = []
 
-    for i, chunk in enumerate(chunks):
-        print(f"Processing chunk {i + 1}/{len(chunks)}...")
-        result = map_chain.invoke({"chunk_text": chunk})
-        try:
-            parsed_chunk = json.loads(result)
-            partial_jsons.append(parsed_chunk)
-        except json.JSONDecodeError:
-            print(f"⚠️ Chunk {i + 1} produced invalid JSON, skipping.")
+    def chunk_inputs() -> Iterator[Dict[str, str]]:
+        nonlocal chunks_seen, chunks_total
+        for number, chunk in filter_chunks(iter_map_chunks(iter_pages(pdf_path)), scorer, filtered_chunks,
+                                            mode=RELEVANCE_FILTER):
+            chunks_seen += 1
+            chunk_numbers.append(number)
+            yield {"chunk_text": chunk}
+        chunks_total = chunks_seen
+        print(f"Extraction finished: {chunks_total} chunks.")
+
+    print(f"Processing chunks as they are extracted (max {MAP_MAX_CONCURRENCY} in flight)...")
+    chunks_done = 0
+
+    def chunk_done(idx: int, fragment: Optional[Dict[str, Any]]):
+        nonlocal chunks_done
+        chunks_done += 1
+        emit({
+            "event": "chunk_completed",
+            # Same numbering as low_relevance_chunks.json
+            "chunk": chunk_numbers[idx],
+            "chunks_done": chunks_done,
+            "chunks_seen": chunks_seen,
+            # None while the PDF is still being extracted
+            "chunks_total": chunks_total,
+            "fragment": fragment,
+        })
+
+    map_results = invoke_json_bounded(
+        map_chain,
+        chunk_inputs(),
+        max_concurrency=MAP_MAX_CONCURRENCY,
+        call_timeout=MAP_CALL_TIMEOUT_S,
+        on_result=chunk_done,
+        prefetch_size=MAP_PREFETCH_CHUNKS,
+    )
+    partial_jsons = [fragment for fragment in map_results if fragment is not None]
+    if map_chain.reused:
+        print(f"♻️ Reused stored outputs for {map_chain.reused}/{chunks_seen} chunk(s).")
+
+    if RELEVANCE_FILTER != "off":
+        action = "deferred" if RELEVANCE_FILTER == "defer" else "dropped"
+        print(f"Relevance filter: {len(filtered_chunks)} low-value chunk(s) {action} (threshold {RELEVANCE_THRESHOLD}).")
+        emit({"event": "chunks_filtered", "mode": RELEVANCE_FILTER, f"chunks_{action}": len(filtered_chunks)})
+        if output_path:
+            persist_json(os.path.join(os.path.dirname(output_path), "low_relevance_chunks.json"), {
+                "pdf_path": pdf_path,
+                "mode": RELEVANCE_FILTER,
+                "threshold": RELEVANCE_THRESHOLD,
+                # Deferred chunks were mapped too (last), dropped ones were not
+                "chunks_mapped": chunks_seen,
+                f"chunks_{action}": len(filtered_chunks),
+                "chunks": filtered_chunks,
+            })
 
     # Merge all partial outputs
     reduce_chain = REDUCE_PROMPT | model | StrOutputParser()
     schema_str = json.dumps(EXPECTED_SCHEMA_EXAMPLE, indent=2)
-    final_summary_input = json.dumps(partial_jsons, indent=2)
 
-    print("Merging extracted fragments...")
-    merged_output = reduce_chain.invoke({
-        "schema": schema_str,
-        "partials_json": final_summary_input
-    })
+    emit({"event": "reduce_started", "fragments": len(partial_jsons), "mode": REDUCE_MODE})
+    already_merged = False
+    if REDUCE_MODE == "local":
+        print("Merging extracted fragments locally...")
+        merged, conflicts = premerge_fragments(partial_jsons)
+        conflict_chain = CONFLICT_PROMPT | model | StrOutputParser()
+        partial_jsons = [resolve_conflicts(conflict_chain, merged, conflicts)]
+        already_merged = True
+    elif REDUCE_MODE == "tree":
+        partial_jsons, already_merged = tree_reduce(reduce_chain, partial_jsons, schema_str)
+
+    if already_merged and len(partial_jsons) == 1:
+        # The local merge or the last tree level produced a single schema-shaped result.
+        merged_output = json.dumps(partial_jsons[0])
+    else:
+        final_summary_input = json.dumps(partial_jsons, indent=2)
+
+        print("Merging extracted fragments...")
+        merged_output = reduce_chain.invoke({
+            "schema": schema_str,
+            "partials_json": final_summary_input
+        })
 
     try:
         final_json = json.loads(merged_output)
@@ -146,14 +673,15 @@ def main_agent_pipeline() -> Dict[str, Any]:
         print("⚠️ Invalid JSON from LLM, saving raw output.")
         final_json = {"raw_text": merged_output}
 
-    # Save to disk for traceability
-    with open(OUTPUT_JSON_PATH, "w", encoding="utf-8") as f:
-        json.dump(final_json, f, indent=2)
+    # Save to disk for traceability (off the critical path)
+    if output_path:
+        persist_json(output_path, final_json)
 
-    print(f"✅ Main Agent completed. Output saved to {OUTPUT_JSON_PATH}")
+    print(f"✅ Main Agent completed.{f' Output saved to {output_path}' if output_path else ''}")
     return final_json
 
 
 if __name__ == "__main__":
     main_agent_pipeline()
+    flush_reports()
 
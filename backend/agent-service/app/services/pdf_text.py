@@ -0,0 +1,184 @@
+"""
+pdf_text.py
+
+Page text extraction for RFP PDFs.
+
+Large tender bundles are parsed in parallel: the page range is split into blocks
+of PDF_PAGES_PER_TASK pages and each block is extracted by pypdf in a worker
+process. Extracted pages are cached on disk under ./lib/cache/pdf_text, keyed by
+the SHA-256 of the PDF bytes, so re-processing the same file (or an identical
+copy under another name) skips parsing entirely.
+
+Pages are produced as a stream (`iter_pages`), in order, as soon as they are
+extracted, so callers can start working on the first pages while the rest of the
+document is still being parsed.
+
+Usage:
+    for page in iter_pages("tender.pdf"):  # one string per page
+        ...
+    pages = extract_pages("tender.pdf")
+"""
+
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+import pypdf
+
+# CONFIG
+PDF_TEXT_CACHE_ENABLED = os.getenv("PDF_TEXT_CACHE_ENABLED", "1") != "0"
+PDF_TEXT_CACHE_DIR = os.getenv("PDF_TEXT_CACHE_DIR", "./lib/cache/pdf_text")
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = 25
+# Below this many pages, worker start-up costs more than it saves.
+PDF_PARALLEL_MIN_PAGES = 40
+# Workers are spawned, not forked: extraction starts from a thread of a process that
+# runs other threads (uvicorn, job pool, map calls), and a forked child can inherit
+# a lock held by one of them and deadlock.
+PDF_WORKER_START_METHOD = "spawn"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_text(page: "pypdf.PageObject") -> str:
+    """Text of one page, extracted the same way as PyPDFLoader."""
+    return page.extract_text(extraction_mode="plain").strip()
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end)."""
+    reader = pypdf.PdfReader(pdf_path)
+    return [page_text(reader.pages[i]) for i in range(start, end)]
+
+
+def page_count(pdf_path: str) -> int:
+    return len(pypdf.PdfReader(pdf_path).pages)
+
+
+def page_ranges(total_pages: int, pages_per_task: int = PDF_PAGES_PER_TASK) -> List[tuple]:
+    return [(start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task)]
+
+
+# ------------------ Cache (JSON Lines: header, then one page per line) ------------------
+def _cache_path(content_hash: str) -> str:
+    return os.path.join(PDF_TEXT_CACHE_DIR, f"{content_hash}.jsonl")
+
+
+def iter_cached_pages(content_hash: str) -> Optional[Iterator[str]]:
+    """Cached pages for this PDF, read lazily; None on a miss."""
+    if not PDF_TEXT_CACHE_ENABLED:
+        return None
+    try:
+        f = open(_cache_path(content_hash), "r", encoding="utf-8")
+    except OSError:
+        return None
+    try:
+        header = json.loads(f.readline())
+    except ValueError:
+        header = {}
+    # Text from another pypdf version may differ; re-extract instead of mixing outputs.
+    if header.get("pypdf_version") != pypdf.__version__:
+        f.close()
+        return None
+
+    def pages() -> Iterator[str]:
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    return pages()
+
+
+class _CacheWriter:
+    """Appends pages to a temp file that only replaces the cache entry once every page is in."""
+
+    def __init__(self, content_hash: str):
+        self.path = _cache_path(content_hash)
+        self._tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        self._file = None
+        if not PDF_TEXT_CACHE_ENABLED:
+            return
+        try:
+            os.makedirs(PDF_TEXT_CACHE_DIR, exist_ok=True)
+            self._file = open(self._tmp_path, "w", encoding="utf-8")
+            self._file.write(json.dumps({"pypdf_version": pypdf.__version__}) + "\n")
+        except OSError as e:
+            print(f"Warning: Could not cache extracted text. Error: {e}")
+            self._file = None
+
+    def write(self, page: str) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(page, ensure_ascii=False) + "\n")
+
+    def commit(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.path)
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._tmp_path)
+
+
+# ------------------ Extraction ------------------
+def _extract_in_order(pdf_path: str, max_workers: int) -> Iterator[str]:
+    total_pages = page_count(pdf_path)
+    if max_workers <= 1 or total_pages < PDF_PARALLEL_MIN_PAGES:
+        reader = pypdf.PdfReader(pdf_path)
+        for page in reader.pages:
+            yield page_text(page)
+        return
+
+    all_ranges = page_ranges(total_pages)
+    workers = min(max_workers, len(all_ranges))
+    ranges = iter(all_ranges)
+    mp_context = multiprocessing.get_context(PDF_WORKER_START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        # At most two blocks per worker run ahead of the consumer, so extracted text
+        # never piles up in memory while downstream stages are busy.
+        window = deque(pool.submit(extract_page_range, pdf_path, start, end)
+                       for start, end in islice(ranges, 2 * workers))
+        while window:
+            block = window.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                window.append(pool.submit(extract_page_range, pdf_path, *next_range))
+            yield from block
+
+
+def iter_pages(pdf_path: str, max_workers: int = PDF_EXTRACT_WORKERS) -> Iterator[str]:
+    """Text of every page of `pdf_path`, in order, from the cache when this exact file was seen before."""
+    content_hash = file_sha256(pdf_path)
+    cached = iter_cached_pages(content_hash)
+    if cached is not None:
+        print(f"📄 Reusing cached text for {os.path.basename(pdf_path)}")
+        yield from cached
+        return
+
+    writer = _CacheWriter(content_hash)
+    try:
+        for page in _extract_in_order(pdf_path, max_workers):
+            writer.write(page)
+            yield page
+        writer.commit()
+    finally:
+        writer.discard()
+
+
+def extract_pages(pdf_path: str, max_workers: int = PDF_EXTRACT_WORKERS) -> List[str]:
+    return list(iter_pages(pdf_path, max_workers))
@@ -19,21 +19,39 @@ This script will:
 
 import os
 import time
+import asyncio
 import json
 import argparse
 import logging
 import re
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from urllib.parse import urljoin, urlparse
 from datetime import datetime, timedelta
 
 import requests
-from playwright.sync_api import sync_playwright, Page
+from requests.adapters import HTTPAdapter
+
+from crawl_state import CrawlStateStore
 
 # ---------- CONFIGURATION ----------
 DEFAULT_DOWNLOAD_DIR = "data/raw"
 MANIFEST_PATH = "scraped_rfps_manifest.json"
 DEFAULT_TIMEOUT_MS = 20000
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Concurrent PDF downloads: total workers (one pooled session), max in flight per host,
+# and the base delay for exponential backoff between retries.
+DOWNLOAD_WORKERS = int(os.getenv("SCRAPER_DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_PER_HOST = int(os.getenv("SCRAPER_DOWNLOAD_PER_HOST", "4"))
+DOWNLOAD_BACKOFF_S = 0.5
+
+# Incremental scraping: remember what was downloaded (crawl_state.py), re-check it with
+# conditional requests and list only new/changed tenders in the manifest.
+SCRAPER_INCREMENTAL = os.getenv("SCRAPER_INCREMENTAL", "1") != "0"
 
 # Selectors to wait for on the page, indicating it has likely loaded.
 # Add selectors relevant to your target site.
@@ -72,15 +90,17 @@ def ensure_dir(path: str):
 
 
 def filename_from_url(url: str) -> str:
-    """Generate a safe filename from a URL."""
+    """
+    Generate a safe filename from a URL. A short hash of the full URL is appended so
+    different URLs sharing a basename (e.g. .../2024/notice.pdf, .../2025/notice.pdf)
+    never overwrite each other.
+    """
     p = urlparse(url).path
-    name = os.path.basename(p)
-    if not name:
-        name = f"rfp_{int(time.time())}.pdf"
-    if not name.lower().endswith(".pdf"):
-        name = name + ".pdf"
+    stem = os.path.splitext(os.path.basename(p))[0] or "rfp"
     # Sanitize filename
-    return re.sub(r'[\\/*?:"<>|]', "", name)
+    stem = re.sub(r'[\\/*?:"<>|]', "", stem)[:100]
+    url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+    return f"{stem}_{url_hash}.pdf"
 
 
 def save_manifest(manifest: List[Dict], path: str = MANIFEST_PATH):
@@ -91,35 +111,131 @@ def save_manifest(manifest: List[Dict], path: str = MANIFEST_PATH):
     logger.info(f"Manifest saved with {len(manifest)} entries -> {path}")
 
 
-def download_file_requests(url: str, out_dir: str, headers: dict = None, max_retries: int = 3) -> Optional[str]:
-    """Fallback downloader using the requests library."""
+def make_session(pool_size: int = DOWNLOAD_WORKERS, headers: dict = None) -> requests.Session:
+    """A requests.Session whose keep-alive connection pool fits `pool_size` concurrent downloads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers or {"User-Agent": "Alpine-Scraper/1.0"})
+    return session
+
+
+def fetch_pdf(url: str, out_dir: str, headers: dict = None, max_retries: int = 3,
+              session: Optional[requests.Session] = None,
+              state: Optional[CrawlStateStore] = None) -> Optional[Dict]:
+    """
+    Downloads `url` into `out_dir` with exponential backoff between attempts. The body
+    is streamed to a temp file and renamed into place, so a partial download never
+    shows up under the final name. Pass a shared `session` to reuse connections.
+
+    With a crawl `state`, a URL downloaded before is re-requested conditionally
+    (If-None-Match / If-Modified-Since); a 304, or a 200 with the same content hash,
+    leaves the saved file alone. Without one, an existing file is simply reused.
+
+    Returns {"path", "status"} with status "new", "changed" or "unchanged", or None on failure.
+    """
     ensure_dir(out_dir)
-    headers = headers or {"User-Agent": "Alpine-Scraper/1.0"}
-    fname = filename_from_url(url)
-    out_path = os.path.join(out_dir, fname)
-    if os.path.exists(out_path):
+    headers = dict(headers or {"User-Agent": "Alpine-Scraper/1.0"})
+    out_path = os.path.join(out_dir, filename_from_url(url))
+
+    known = state.get(url) if state is not None else None
+    if known and not os.path.exists(known["path"]):
+        known = None  # the file is gone; fetch it again in full
+    if known:
+        if known["etag"]:
+            headers["If-None-Match"] = known["etag"]
+        if known["last_modified"]:
+            headers["If-Modified-Since"] = known["last_modified"]
+    elif state is None and os.path.exists(out_path):
         logger.info(f"(requests) File already exists, skipping: {out_path}")
-        return out_path
+        return {"path": out_path, "status": "unchanged"}
 
+    http = session or requests
+    tmp_path = f"{out_path}.{threading.get_ident()}.part"
     for attempt in range(1, max_retries + 1):
         try:
             logger.info(f"(requests) Downloading {url} (attempt {attempt})")
-            with requests.get(url, headers=headers, timeout=30, stream=True) as r:
+            digest = hashlib.sha256()
+            with http.get(url, headers=headers, timeout=30, stream=True) as r:
+                if r.status_code == 304 and known:
+                    logger.info(f"(requests) Not modified: {url}")
+                    state.touch(url)
+                    return {"path": known["path"], "status": "unchanged"}
+                if 400 <= r.status_code < 500 and r.status_code != 429:
+                    # Client errors won't fix themselves on retry
+                    logger.error(f"(requests) {url} returned HTTP {r.status_code}, giving up.")
+                    return None
                 r.raise_for_status()
-                with open(out_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
+                with open(tmp_path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=65536):
                         if chunk:
                             f.write(chunk)
+                            digest.update(chunk)
+                etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+
+            content_hash = digest.hexdigest()
+            if known and known["content_hash"] == content_hash:
+                # The server ignored our validators but the content is the same.
+                os.remove(tmp_path)
+                state.record(url, known["path"], content_hash, etag, last_modified)
+                logger.info(f"(requests) Unchanged content: {url}")
+                return {"path": known["path"], "status": "unchanged"}
+
+            os.replace(tmp_path, out_path)
+            if state is not None:
+                state.record(url, out_path, content_hash, etag, last_modified)
             logger.info(f"(requests) Saved -> {out_path}")
-            return out_path
+            return {"path": out_path, "status": "changed" if known else "new"}
         except Exception as e:
             logger.warning(f"(requests) Attempt {attempt} failed for {url}: {e}")
-            time.sleep(0.5 + attempt * 0.5)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if attempt < max_retries:
+                time.sleep(DOWNLOAD_BACKOFF_S * (2 ** (attempt - 1)) * (1 + random.random()))
 
     logger.error(f"(requests) Failed to download {url} after {max_retries} attempts.")
     return None
 
 
+def download_file_requests(url: str, out_dir: str, headers: dict = None, max_retries: int = 3,
+                           session: Optional[requests.Session] = None) -> Optional[str]:
+    """Downloads `url` into `out_dir` (see fetch_pdf) and returns the saved path."""
+    result = fetch_pdf(url, out_dir, headers=headers, max_retries=max_retries, session=session)
+    return result["path"] if result else None
+
+
+def download_all(urls: List[str], out_dir: str, max_workers: int = DOWNLOAD_WORKERS,
+                 per_host: int = DOWNLOAD_PER_HOST,
+                 state: Optional[CrawlStateStore] = None) -> Dict[str, Optional[Dict]]:
+    """
+    Downloads every URL concurrently over one pooled session, with at most `per_host`
+    downloads in flight against the same host. Returns {url: fetch_pdf result or None}.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+
+    host_limits: Dict[str, threading.BoundedSemaphore] = {}
+    host_limits_lock = threading.Lock()
+
+    def fetch(url: str) -> Optional[Dict]:
+        host = urlparse(url).netloc
+        with host_limits_lock:
+            limit = host_limits.setdefault(host, threading.BoundedSemaphore(max(1, per_host)))
+        with limit:
+            return fetch_pdf(url, out_dir, session=session, state=state)
+
+    started = time.perf_counter()
+    with make_session(max_workers) as session, ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = dict(zip(urls, pool.map(fetch, urls)))
+    statuses = [r["status"] for r in results.values() if r]
+    logger.info(f"Fetched {len(statuses)}/{len(urls)} file(s) in {time.perf_counter() - started:.2f}s "
+                f"({statuses.count('new')} new, {statuses.count('changed')} changed, "
+                f"{statuses.count('unchanged')} unchanged)")
+    return results
+
+
 # ------------------ Date Extraction & Filtering ------------------
 def extract_dates_from_text(text: str) -> List[datetime]:
     """Extract dates from text using common formats."""
@@ -160,182 +276,93 @@ def is_within_last_n_months(dates: List[datetime], months: int) -> bool:
     return any(d >= cutoff for d in dates)
 
 
-# ------------------ DOM Context Extraction ------------------
-def get_element_context(page: Page, element_js_locator: str) -> str:
-    """Get text context around a DOM element by traversing up the tree."""
-    js_function = f"""
-    (elementLocator) => {{
-      try {{
-        const el = eval(elementLocator);
-        if (!el) return "";
-
-        let current = el;
-        let depth = 0;
-        // Find the most relevant parent, likely a row or card
-        while (current.parentElement && depth < 5) {{
-            const parent = current.parentElement;
-            const tagName = parent.tagName.toLowerCase();
-            const classList = (parent.getAttribute('class') || '').toLowerCase();
-            // Heuristics for a good container: table rows, list items, cards, etc.
-            if (tagName === 'tr' || tagName === 'li' || classList.includes('row') || classList.includes('card') || classList.includes('item')) {{
-                const text = (parent.innerText || parent.textContent || "").trim();
-                if (text.length > 50) return text; // Found a good container
-            }}
-            current = parent;
-            depth++;
-        }}
-        // Fallback to the original element's parent if no good container is found
-        return (el.parentElement.innerText || el.parentElement.textContent || "").trim();
-      }} catch (e) {{
-        return "";
-      }}
-    }}
-    """
-    try:
-        context_text = page.evaluate(js_function, element_js_locator)
-        return re.sub(r'\s+', ' ', context_text).strip()  # Normalize whitespace
-    except Exception:
-        return ""
+# ------------------ DOM Link Extraction ------------------
+# Walks every anchor once inside the browser and returns [{href, text, context}] in a
+# single round-trip. `href` is the raw attribute (resolved with urljoin later); only
+# links that point at a PDF or read like "view/download/details" get a container context.
+LINK_SCAN_JS = """
+() => {
+  const ACTION_WORDS = ["view", "download", "details"];
+  const containerText = (el) => {
+    let current = el;
+    let depth = 0;
+    // Find the most relevant parent, likely a row or card
+    while (current.parentElement && depth < 5) {
+      const parent = current.parentElement;
+      const tagName = parent.tagName.toLowerCase();
+      const classList = (parent.getAttribute('class') || '').toLowerCase();
+      // Heuristics for a good container: table rows, list items, cards, etc.
+      if (tagName === 'tr' || tagName === 'li' || classList.includes('row') || classList.includes('card') || classList.includes('item')) {
+        const text = (parent.innerText || parent.textContent || "").trim();
+        if (text.length > 50) return text; // Found a good container
+      }
+      current = parent;
+      depth++;
+    }
+    // Fallback to the original element's parent if no good container is found
+    const parent = el.parentElement;
+    return parent ? (parent.innerText || parent.textContent || "").trim() : "";
+  };
+
+  const results = [];
+  for (const a of document.querySelectorAll('a[href]')) {
+    const href = (a.getAttribute('href') || '').trim();
+    if (!href || href === '#' || href === 'javascript:void(0);') continue;
+    const text = (a.innerText || a.textContent || "").trim();
+    const lowered = text.toLowerCase();
+    if (!(href.toLowerCase().includes('.pdf') || ACTION_WORDS.some(w => lowered.includes(w)))) continue;
+    let context = "";
+    try { context = containerText(a); } catch (e) { context = ""; }
+    results.push({ href, text, context });
+  }
+  return results;
+}
+"""
 
 
-# ------------------ Main Scraping Logic ------------------
-def run_scrape(start_url: str, download_dir: str, headless: bool, max_candidates: int):
-    ensure_dir(download_dir)
-    manifest = []
+def select_candidates(links: List[Dict], start_url: str, max_candidates: int) -> List[Dict]:
+    """Keeps links whose context mentions a keyword and a date within DATE_MONTHS_THRESHOLD months."""
+    filtered_links = []
+    for link in links:
+        context_text = re.sub(r'\s+', ' ', link.get("context") or "").strip()  # Normalize whitespace
+        if not context_text:
+            context_text = link.get("text") or ""
 
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=headless)
-        context = browser.new_context(accept_downloads=True,
-                                      user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-        page = context.new_page()
+        # Filter by keywords
+        if not any(kw.lower() in context_text.lower() for kw in KEYWORDS):
+            continue
 
-        try:
-            logger.info(f"Navigating to {start_url}")
-            page.goto(start_url, wait_until="networkidle", timeout=DEFAULT_TIMEOUT_MS)
-
-            # Wait for page to likely be loaded
-            logger.info("Waiting for page content to load...")
-            page.wait_for_selector(f"text=/{'|'.join(KEYWORDS)}/i", timeout=5000)
-        except Exception:
-            logger.warning("Could not find keywords on initial load, waiting for a generic selector.")
-            try:
-                page.wait_for_selector(", ".join(DEFAULT_WAIT_SELECTOR_LIST), timeout=5000)
-            except Exception:
-                logger.warning("Generic selectors not found, proceeding after a short delay.")
-                page.wait_for_timeout(3000)
-
-        # Scroll to load any lazy-loaded content
-        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        page.wait_for_timeout(1000)
-        page.evaluate("window.scrollTo(0, 0)")
-        page.wait_for_timeout(500)
-
-        # Find all potential links
-        links = page.query_selector_all("a[href]")
-        logger.info(f"Found {len(links)} total links on the page.")
-
-        filtered_links = []
-        for i, link in enumerate(links):
-            try:
-                href = link.get_attribute("href")
-                if not href or href.strip() in ('#', 'javascript:void(0);'):
-                    continue
-                if not ('.pdf' in href.lower() or any(
-                        kw in (link.inner_text() or '').lower() for kw in ["view", "download", "details"])):
-                    continue
+        # Filter by date
+        dates = extract_dates_from_text(context_text)
+        if not is_within_last_n_months(dates, DATE_MONTHS_THRESHOLD):
+            continue
 
-                # Create a stable JS locator for this element
-                js_locator = f"document.querySelectorAll('a[href]')[{i}]"
-                context_text = get_element_context(page, js_locator)
+        filtered_links.append({
+            "href": urljoin(start_url, link["href"]),
+            "context": context_text,
+            "title": link.get("text") or "",
+        })
 
-                if not context_text:
-                    context_text = (link.inner_text() or "").strip()
+        if len(filtered_links) >= max_candidates:
+            break
+    return filtered_links
 
-                # Filter by keywords
-                if not any(kw.lower() in context_text.lower() for kw in KEYWORDS):
-                    continue
 
-                # Filter by date
-                dates = extract_dates_from_text(context_text)
-                if not is_within_last_n_months(dates, DATE_MONTHS_THRESHOLD):
-                    continue
+# ------------------ Main Scraping Logic ------------------
+def run_scrape(start_url: str, download_dir: str, headless: bool, max_candidates: int):
+    """Runs the async scraping engine (scraper_engine.py) on a browser launched for this run."""
+    # Imported here because scraper_engine builds on the helpers in this module.
+    from scraper_engine import BrowserPool
 
-                filtered_links.append({
-                    "href": urljoin(start_url, href),
-                    "context": context_text,
-                    "title": (link.inner_text() or "").strip(),
-                    "link_handle": link
-                })
+    async def scrape():
+        pool = BrowserPool(headless=headless, max_contexts=1)
+        await pool.start()
+        try:
+            return await pool.run_scrape(start_url, download_dir, max_candidates, MANIFEST_PATH)
+        finally:
+            await pool.stop()
 
-                if len(filtered_links) >= max_candidates:
-                    break
-            except Exception as e:
-                logger.debug(f"Error processing link: {e}")
-                continue
-
-        logger.info(f"Found {len(filtered_links)} relevant candidates after filtering.")
-
-        # Process and download from filtered links
-        for candidate in filtered_links:
-            href = candidate["href"]
-            if href.lower().endswith(".pdf"):
-                path = download_file_requests(href, download_dir)
-                if path:
-                    manifest.append({
-                        "title": candidate["title"],
-                        "pdf_url": href,
-                        "download_path": path,
-                        "context": candidate["context"]
-                    })
-            else:  # It's a detail page, not a direct PDF link
-                logger.info(f"Navigating to detail page: {href}")
-                try:
-                    with page.expect_navigation(wait_until="networkidle", timeout=10000):
-                        candidate["link_handle"].click()
-
-                    detail_page_url = page.url
-                    # Find PDF links on the detail page
-                    pdf_links = page.query_selector_all("a[href$='.pdf']")
-                    if pdf_links:
-                        pdf_href = pdf_links[0].get_attribute("href")
-                        absolute_pdf_url = urljoin(detail_page_url, pdf_href)
-                        path = download_file_requests(absolute_pdf_url, download_dir)
-                        if path:
-                            manifest.append({
-                                "title": candidate["title"],
-                                "pdf_url": absolute_pdf_url,
-                                "download_path": path,
-                                "context": candidate["context"]
-                            })
-                    else:
-                        logger.warning(f"No direct PDF link found on detail page: {detail_page_url}")
-
-                    # Go back to the main list page to continue
-                    page.go_back(wait_until="networkidle")
-
-                except Exception as e:
-                    logger.error(f"Failed to process detail page {href}: {e}")
-                    # If navigation fails, try to go back or reload the start page
-                    try:
-                        page.goto(start_url, wait_until="networkidle")
-                    except Exception:
-                        logger.error("Failed to return to start URL. Aborting.")
-                        break
-
-        context.close()
-        browser.close()
-
-    # Deduplicate and save manifest
-    seen_urls = set()
-    final_manifest = []
-    for entry in manifest:
-        url_key = entry["pdf_url"]
-        if url_key not in seen_urls:
-            final_manifest.append(entry)
-            seen_urls.add(url_key)
-
-    save_manifest(final_manifest, MANIFEST_PATH)
-    return final_manifest
+    return asyncio.run(scrape())
 
 
 def main():
@@ -353,7 +380,7 @@ def main():
         headless=args.headless,
         max_candidates=args.max_candidates
     )
-    print(f"\nScraping complete. Downloaded {len(results)} new PDF(s).")
+    print(f"\nScraping complete. Downloaded {len(results)} new or changed PDF(s).")
     print(f"Manifest file created at: {MANIFEST_PATH}")
 
 
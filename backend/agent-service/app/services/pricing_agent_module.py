@@ -1,24 +1,26 @@
 import os
 import json
+from decimal import Decimal, ROUND_HALF_UP
 import numpy as np
-from typing import List, Dict, Any
 from dotenv import load_dotenv
-
-# Vectorstore / embeddings
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-
-# LangChain chaining & prompts
+from typing import Dict, Any, List, Optional
+from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-# Hugging Face LLM wrappers
-from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
+from llm_cache import get_llm_cache
+from report_store import persist_json, flush as flush_reports
 
 # CONFIG
-RFP_JSON_PATH = ".lib/reports/rfp_summary.json"
-OEM_JSON_PATH = "./constants/oem_products.json"
-OUTPUT_TECHNICAL_JSON = "./lib/reports/technical_agent_output.json"
+TECH_OUTPUT_PATH = "./lib/reports/technical_agent_output.json"
+RFP_SUMMARY_PATH = "./lib/reports/rfp_summary.json"
+PRODUCT_PRICE_PATH = "./constants/product_prices.json"
+SERVICE_PRICE_PATH = "./constants/test_service_prices.json"
+OUTPUT_PRICING_JSON = "./lib/reports/pricing_agent_output.json"
+
+# Services added to every winning item (the LLM prompt's "Installation, Commissioning, FAT, SAT").
+# Any other service from test_service_prices.json is added when the RFP summary mentions it.
+DEFAULT_SERVICES = ["Installation & Commissioning", "FAT", "SAT"]
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -29,166 +31,269 @@ class NumpyEncoder(json.JSONEncoder):
         if isinstance(obj, np.ndarray):
             return obj.tolist()
         return super(NumpyEncoder, self).default(obj)
-# 1. LLM Loader
+
+# LLM loader
 def llm_model():
     load_dotenv()
     api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
     if not api_token:
         raise RuntimeError("HUGGINGFACEHUB_API_TOKEN not set.")
-
-    # Using the Endpoint directly is often faster/stable than Chat wrapper for pure completion,
-    # but we will stick to ChatHuggingFace as requested.
-    hf_endpoint = HuggingFaceEndpoint(
+    llm = HuggingFaceEndpoint(
         repo_id="Qwen/Qwen2.5-Coder-32B-Instruct",
         task="text-generation",
         huggingfacehub_api_token=api_token,
-        max_new_tokens=1500,
-        temperature=0.2,
+        max_new_tokens=2000,
+        temperature=0.0,  # Strict determinism
     )
-    return ChatHuggingFace(llm=hf_endpoint)
+    return ChatHuggingFace(llm=llm, cache=get_llm_cache(llm.repo_id, llm.temperature, llm.max_new_tokens))
 
 
-# 2. Simple JSON Loader
-def load_json(file_path: str) -> Dict[str, Any]:
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}. Returning empty dict.")
+def load_json(path: str):
+    if not os.path.exists(path):
         return {}
-    with open(file_path, "r", encoding="utf-8") as f:
+    with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-# 3. Build FAISS Index
-def build_faiss_index(oem_products: List[Dict[str, Any]]):
-    if not oem_products:
-        print("No OEM products found to index.")
+# --- MODIFIED PROMPT FOR TOP 1 ONLY ---
+PRICING_PROMPT = PromptTemplate(
+    input_variables=[
+        "tech_json",
+        "rfp_json",
+        "product_prices_json",
+        "service_prices_json"
+    ],
+    template=(
+        "You are a deterministic Pricing Agent. You will receive technical recommendations and must generate a quote ONLY for the winning OEM.\n\n"
+
+        "INPUTS:\n"
+        "1) technical_output: Contains 'RFP_Product', 'Top_OEM', and 'Top_3_Recommendations'.\n"
+        "2) product_prices: Mapping of Model/OEM to unit prices (INR).\n"
+        "3) service_prices: Mapping of service names to prices (INR).\n"
+        "4) rfp_summary: Context on required tests.\n\n"
+
+        "TASK:\n"
+        "For each item in technical_output:\n"
+        "1. Identify the 'Top_OEM'.\n"
+        "2. Find the single object in 'Top_3_Recommendations' that belongs to this Top_OEM.\n"
+        "   - If 'Top_3_Recommendations' is empty, return 'Status': 'No Technical Match Found'.\n"
+        "3. Compute pricing for ONLY this single winning item.\n"
+        "   - Base Price: Lookup Model > Product_Type > OEM in product_prices.\n"
+        "   - Services: Add 'Installation', 'Commissioning', 'FAT', 'SAT' costs from service_prices.\n"
+        "   - Total: Base Price + Services.\n"
+        "4. If price is missing, use 'To Be Quoted'.\n\n"
+
+        "STRICT OUTPUT JSON SCHEMA:\n"
+        "{{\n"
+        "  \"Pricing_Summary\": [\n"
+        "    {{\n"
+        "      \"RFP_Product\": \"<string>\",\n"
+        "      \"Winning_OEM\": \"<string>\",\n"
+        "      \"Winning_Quote\": {{\n"
+        "          \"Model\": \"<string>\",\n"
+        "          \"Unit_Price_INR\": <int or 'To Be Quoted'>,\n"
+        "          \"Services_Cost_INR\": <int>,\n"
+        "          \"Applied_Services\": [\"FAT\", \"SAT\", ...],\n"
+        "          \"Total_Item_Cost\": <int or 'To Be Quoted'>\n"
+        "      }}\n"
+        "    }}\n"
+        "  ],\n"
+        "  \"Grand_Total_INR\": <int>\n"
+        "}}\n\n"
+
+        "DATA:\n"
+        "TECHNICAL_OUTPUT:\n{tech_json}\n\n"
+        "PRODUCT_PRICES:\n{product_prices_json}\n\n"
+        "SERVICE_PRICES:\n{service_prices_json}\n\n"
+        "RFP_SUMMARY:\n{rfp_json}\n\n"
+
+        "Return ONLY valid JSON. No markdown."
+    )
+)
+
+
+# --- DETERMINISTIC PRICING ENGINE ---
+def _price_key(name: Any) -> str:
+    return " ".join(str(name or "").split()).casefold()
+
+
+def _whole_rupees(price: float) -> int:
+    """Rounds a price to whole rupees, halves up (2.5 -> 3), instead of truncating it."""
+    return int(Decimal(str(price)).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+class PriceBook:
+    """Indexed view of product_prices.json / test_service_prices.json for O(1) lookups."""
+
+    def __init__(self, product_prices: Dict[str, Any], service_prices: Dict[str, Any]):
+        self.product_prices = {_price_key(k): v for k, v in (product_prices or {}).items()}
+        self.service_prices = dict(service_prices or {})
+
+    def _lookup(self, *names: Any) -> Optional[int]:
+        for name in names:
+            price = self.product_prices.get(_price_key(name)) if name else None
+            if isinstance(price, (int, float)) and not isinstance(price, bool):
+                return _whole_rupees(price)
         return None
 
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    texts, metas = [], []
-    for prod in oem_products:
-        desc = (
-                f"{prod.get('Product_Type', '')} by {prod.get('OEM', '')}, Model {prod.get('Model', '')}. "
-                + " ".join(f"{k}: {v}." for k, v in prod.get("Specs", {}).items())
+    def unit_price(self, model: Any, product_type: Any, oem: Any) -> Optional[int]:
+        """Lookup order: Model > Product_Type (default_<type>, then <type>) > OEM."""
+        return self._lookup(
+            model,
+            f"default_{product_type}" if product_type else None,
+            product_type,
+            f"default_{oem}" if oem else None,
+            oem,
         )
-        texts.append(desc)
-        metas.append(prod)
 
-    db = FAISS.from_texts(texts, embedding=embeddings, metadatas=metas)
-    return db
+    def services_for(self, rfp: Dict[str, Any]) -> List[str]:
+        """DEFAULT_SERVICES plus any other priced service the RFP summary mentions."""
+        mentions = []
+        for section, field in (("Pricing_Summary", "Tests_Required"), ("Pricing_Summary", "Services"),
+                               ("Technical_Summary", "Tests_And_Standards")):
+            values = (rfp.get(section) or {}).get(field) or []
+            mentions.extend(values if isinstance(values, list) else [values])
+        rfp_text = _price_key(" ".join(str(v) for v in mentions))
+
+        applied = [name for name in DEFAULT_SERVICES if name in self.service_prices]
+        for name in self.service_prices:
+            if name not in applied and _price_key(name) in rfp_text:
+                applied.append(name)
+        return applied
+
+    def services_cost(self, services: List[str]) -> int:
+        return sum(_whole_rupees(self.service_prices[name]) for name in services if name in self.service_prices)
+
+
+def price_recommendation(rec: Dict[str, Any], price_book: PriceBook, services: List[str]) -> Dict[str, Any]:
+    """Quote for the Top_OEM's item of one technical recommendation."""
+    product = rec.get("RFP_Product", "")
+    top_oem = rec.get("Top_OEM") or "Unknown"
+    candidates = rec.get("Top_3_Recommendations") or []
+    winner = next((c for c in candidates if c.get("OEM") == top_oem), candidates[0] if candidates else None)
+
+    if winner is None:
+        return {"RFP_Product": product, "Winning_OEM": top_oem, "Status": "No Technical Match Found"}
+
+    unit_price = price_book.unit_price(winner.get("Model"), winner.get("Product_Type"), winner.get("OEM"))
+    services_cost = price_book.services_cost(services)
+    return {
+        "RFP_Product": product,
+        "Winning_OEM": winner.get("OEM", top_oem),
+        "Winning_Quote": {
+            "Model": winner.get("Model", ""),
+            "Unit_Price_INR": unit_price if unit_price is not None else "To Be Quoted",
+            "Services_Cost_INR": services_cost,
+            "Applied_Services": list(services),
+            "Total_Item_Cost": unit_price + services_cost if unit_price is not None else "To Be Quoted",
+        },
+    }
+
+
+def grand_total(summary: List[Dict[str, Any]]) -> int:
+    """Sum of the priced items' Total_Item_Cost; "To Be Quoted" items are left out."""
+    return sum(
+        item["Winning_Quote"]["Total_Item_Cost"] for item in summary
+        if isinstance(item.get("Winning_Quote", {}).get("Total_Item_Cost"), int)
+    )
 
 
-# 4. Semantic Match Logic
-def find_top_matches(db, query: str, top_k: int = 5):
-    if db is None:
-        return []
+def compute_pricing(tech: Dict[str, Any], rfp: Dict[str, Any], price_book: PriceBook) -> Dict[str, Any]:
+    """Same Pricing_Summary / Grand_Total_INR schema as the LLM pipeline, computed in code."""
+    services = price_book.services_for(rfp or {})
+    summary = [price_recommendation(rec, price_book, services) for rec in tech.get("RFP_Technical_Recommendations", [])]
+    return {"Pricing_Summary": summary, "Grand_Total_INR": grand_total(summary)}
 
-    try:
-        # FAISS default is L2 distance (lower is better)
-        results_with_scores = db.similarity_search_with_score(query, k=top_k)
-        results = []
-
-        for doc, raw_score in results_with_scores:
-            # Simple conversion: L2 distance to a generic 0-100 score
-            # Note: This is a rough heuristic. Lower L2 = Higher Similarity.
-            # Assuming raw_score is L2 distance.
-            similarity_score = max(0, 100 - (raw_score * 10))
-
-            meta = doc.metadata
-            results.append({
-                "OEM": meta.get("OEM"),
-                "Model": meta.get("Model"),
-                "Product_Type": meta.get("Product_Type"),
-                "Specs": meta.get("Specs"),
-                "Semantic_Score": round(similarity_score, 2)
-            })
-        return results
-
-    except Exception as e:
-        print(f"Error in vector search: {e}")
-        return []
-
-
-# 5. Prompt Definition
-TECH_PROMPT = PromptTemplate(
-    input_variables=["product_name", "matches"],
-    template=(
-        "You are a TECHNICAL AGENT.\n"
-        "Input RFP product: {product_name}\n\n"
-        "Analyze the matches below and select the best fit based on specs.\n"
-        "Matches (raw JSON list):\n{matches}\n\n"
-        "Provide ONLY valid JSON output with the following keys:\n"
-        " - RFP_Product (string)\n"
-        " - Top_3_Recommendations (list of objects with OEM, Model, Product_Type, Specs, Semantic_Score)\n"
-        " - Top_OEM (string: OEM of the highest Semantic_Score)\n\n"
-        "Do not include Markdown formatting (like ```json). Return only the raw JSON string."
-    )
-)
 
+def pricing_agent_pipeline(price_book: Optional[PriceBook] = None, tech: Optional[Dict[str, Any]] = None,
+                           rfp: Optional[Dict[str, Any]] = None, output_path: Optional[str] = OUTPUT_PRICING_JSON):
+    """
+    Prices the technical output in code. Inputs not passed in are read from the
+    report paths; the result is returned and saved to `output_path` in the background unless that is None.
+    """
+    print("Running Top-1 Pricing Agent (deterministic engine)...")
+
+    if tech is None:
+        tech = load_json(TECH_OUTPUT_PATH)
+    if rfp is None:
+        rfp = load_json(RFP_SUMMARY_PATH)
+    if price_book is None:
+        price_book = PriceBook(load_json(PRODUCT_PRICE_PATH), load_json(SERVICE_PRICE_PATH))
 
-# 6. Main Pipeline
-def technical_agent_pipeline():
-    print("Initializing Technical Agent...")
-    llm = llm_model()
+    # Check if tech output is valid
+    if not tech or "RFP_Technical_Recommendations" not in tech:
+        print("Error: technical_agent_output.json is missing or invalid.")
+        return
 
-    # Load Data
-    rfp = load_json(RFP_JSON_PATH)
-    oems = load_json(OEM_JSON_PATH)  # Expecting a list of dicts directly, or a dict containing a list
-    if isinstance(oems, dict) and "products" in oems: oems = oems["products"]
+    result = compute_pricing(tech, rfp, price_book)
 
-    # Build Vector DB
-    db = build_faiss_index(oems)
+    if output_path:
+        persist_json(output_path, result)
 
-    products_in_scope = rfp.get("Technical_Summary", {}).get("Products_In_Scope", [])
-    results = []
+    print(f"✅ Pricing complete. Quote generated for Top OEMs only{f' -> {output_path}' if output_path else ''}")
+    return result
 
-    # Initialize Chain (Using LCEL)
-    # Prompt -> LLM -> String Output Parser
-    chain = TECH_PROMPT | llm | StrOutputParser()
 
-    for product in products_in_scope:
-        print(f"Processing RFP Requirement: {product}")
+def pricing_agent_llm_pipeline(llm=None, product_prices=None, service_prices=None, tech=None, rfp=None,
+                               output_path: Optional[str] = OUTPUT_PRICING_JSON):
+    print("Running Top-1 Pricing Agent...")
 
-        # 1. Retrieve Matches
-        matches = find_top_matches(db, product, top_k=5)
-        matches_json = json.dumps(matches, indent=2, ensure_ascii=False, cls=NumpyEncoder)
+    if tech is None:
+        tech = load_json(TECH_OUTPUT_PATH)
+    if rfp is None:
+        rfp = load_json(RFP_SUMMARY_PATH)
+    if product_prices is None:
+        product_prices = load_json(PRODUCT_PRICE_PATH)
+    if service_prices is None:
+        service_prices = load_json(SERVICE_PRICE_PATH)
 
-        # 2. Generate Recommendations
-        try:
-            llm_output = chain.invoke({"product_name": product, "matches": matches_json})
+    # Check if tech output is valid
+    if not tech or "RFP_Technical_Recommendations" not in tech:
+        print("Error: technical_agent_output.json is missing or invalid.")
+        return
 
-            # Clean string if LLM adds markdown blocks
-            clean_output = llm_output.replace("```json", "").replace("```", "").strip()
-            parsed = json.loads(clean_output)
+    # Prepare inputs
+    tech_str = json.dumps(tech, indent=2, ensure_ascii=False, cls=NumpyEncoder)
+    rfp_str = json.dumps(rfp, indent=2, ensure_ascii=False, cls=NumpyEncoder)
+    prod_prices_str = json.dumps(product_prices, indent=2, ensure_ascii=False, cls=NumpyEncoder)
+    svc_prices_str = json.dumps(service_prices, indent=2, ensure_ascii=False, cls=NumpyEncoder)
+
+    llm = llm or llm_model()
+    chain = PRICING_PROMPT | llm | StrOutputParser()
+
+    print("Calculations in progress...")
+    try:
+        llm_response = chain.invoke({
+            "tech_json": tech_str,
+            "rfp_json": rfp_str,
+            "product_prices_json": prod_prices_str,
+            "service_prices_json": svc_prices_str
+        })
 
-            result = {
-                "RFP_Product": parsed.get("RFP_Product", product),
-                "Top_3_Recommendations": parsed.get("Top_3_Recommendations", matches[:3]),
-                "Top_OEM": parsed.get("Top_OEM", matches[0]["OEM"] if matches else "Unknown")
-            }
+        # Clean potential markdown wrappers
+        cleaned_response = llm_response.replace("```json", "").replace("```", "").strip()
 
-        except json.JSONDecodeError:
-            print("  - LLM JSON Error. Using deterministic fallback.")
-            result = {
-                "RFP_Product": product,
-                "Top_3_Recommendations": matches[:3],
-                "Top_OEM": matches[0]["OEM"] if matches else "Unknown",
-                "Note": "Fallback due to LLM parsing error"
-            }
-        except Exception as e:
-            print(f"  - Pipeline Error: {e}")
-            result = {"RFP_Product": product, "Error": str(e)}
+        parsed = json.loads(cleaned_response)
 
-        results.append(result)
+        # Validation
+        if "Grand_Total_INR" not in parsed:
+            parsed["Grand_Total_INR"] = 0
 
-    # Output
-    final_output = {"RFP_Technical_Recommendations": results}
+        if output_path:
+            persist_json(output_path, parsed)
 
-    with open(OUTPUT_TECHNICAL_JSON, "w", encoding="utf-8") as f:
-        json.dump(final_output, f, indent=2, ensure_ascii=False)
+        print(f"✅ Pricing complete. Quote generated for Top OEMs only{f' -> {output_path}' if output_path else ''}")
+        return parsed
 
-    print(f"Technical Agent done. Output saved to -> {OUTPUT_TECHNICAL_JSON}")
-    return final_output
+    except json.JSONDecodeError:
+        print("❌ LLM output was not valid JSON.")
+        # Save raw output for debugging
+        debug_path = os.path.join(os.path.dirname(output_path or "") or ".", "pricing_debug.txt")
+        with open(debug_path, "w", encoding="utf-8") as f:
+            f.write(llm_response)
+        raise
 
 
 if __name__ == "__main__":
-    technical_agent_pipeline()
\ No newline at end of file
+    pricing_agent_pipeline()
+    flush_reports()
\ No newline at end of file
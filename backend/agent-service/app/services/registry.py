@@ -0,0 +1,140 @@
+"""
+registry.py
+
+Process-wide registry of the heavy objects the agent pipelines need: LLM clients,
+the sentence-transformers embedding model, the OEM catalog index, the parsed
+constants and the compiled LangGraph workflow.
+
+The FastAPI app builds it once at startup (`init_registry`) and every request
+reuses it. Each component is built lazily under its own lock, so scripts that
+never call `init_registry` only pay for what they use, and independent graph
+branches (e.g. catalog loading vs. PDF extraction) can warm components concurrently.
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import main_agent_module
+import technical_agent_module
+import pricing_agent_module
+import chunking
+import relevance
+
+
+class AgentRegistry:
+    def __init__(self):
+        load_dotenv()
+        self._components: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _component(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._locks_guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._components:
+                self._components[name] = factory()
+            return self._components[name]
+
+    # LLM clients (one per agent, each with its own generation settings)
+    @property
+    def main_llm(self):
+        return self._component("main_llm", main_agent_module.llm_model)
+
+    @property
+    def technical_llm(self):
+        return self._component("technical_llm", technical_agent_module.llm_model)
+
+    @property
+    def pricing_llm(self):
+        return self._component("pricing_llm", pricing_agent_module.llm_model)
+
+    @property
+    def tokenizer(self):
+        """Tokenizer used to size map chunks (None falls back to a length estimate)."""
+        return self._component("tokenizer", chunking.get_tokenizer)
+
+    # Parsed constants
+    @property
+    def oem_products(self) -> List[Dict[str, Any]]:
+        def load():
+            oems = technical_agent_module.load_json(technical_agent_module.OEM_JSON_PATH)
+            if isinstance(oems, dict) and "products" in oems:
+                oems = oems["products"]
+            return oems or []
+        return self._component("oem_products", load)
+
+    @property
+    def product_prices(self) -> Dict[str, Any]:
+        return self._component(
+            "product_prices", lambda: pricing_agent_module.load_json(pricing_agent_module.PRODUCT_PRICE_PATH)
+        )
+
+    @property
+    def service_prices(self) -> Dict[str, Any]:
+        return self._component(
+            "service_prices", lambda: pricing_agent_module.load_json(pricing_agent_module.SERVICE_PRICE_PATH)
+        )
+
+    @property
+    def price_book(self) -> "pricing_agent_module.PriceBook":
+        return self._component(
+            "price_book", lambda: pricing_agent_module.PriceBook(self.product_prices, self.service_prices)
+        )
+
+    # Embedding model + catalog index
+    @property
+    def embeddings(self):
+        return self._component("embeddings", technical_agent_module.embedding_model)
+
+    @property
+    def chunk_scorer(self) -> "relevance.ChunkScorer":
+        def build():
+            try:
+                return relevance.ChunkScorer(self.embeddings)
+            except Exception as e:
+                print(f"⚠️ Embedding model unavailable for the relevance filter ({e}); using keywords only.")
+                return relevance.ChunkScorer()
+        return self._component("chunk_scorer", build)
+
+    @property
+    def oem_index(self):
+        return self._component(
+            "oem_index", lambda: technical_agent_module.build_faiss_index(self.oem_products, self.embeddings)
+        )
+
+    @property
+    def graph(self):
+        """The compiled workflow."""
+        def compile_graph():
+            # Imported here because final.py itself pulls objects from this registry.
+            from final import compile_graph
+            return compile_graph()
+        return self._component("graph", compile_graph)
+
+    def warm_up(self) -> None:
+        """Builds every component up front."""
+        for name in ("main_llm", "technical_llm", "pricing_llm", "tokenizer", "chunk_scorer",
+                     "price_book", "oem_index", "graph"):
+            getattr(self, name)
+
+
+_registry: Optional[AgentRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def init_registry() -> AgentRegistry:
+    """Creates the registry (if needed) and builds all of its components."""
+    registry = get_registry()
+    registry.warm_up()
+    return registry
+
+
+def get_registry() -> AgentRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = AgentRegistry()
+        return _registry
@@ -0,0 +1,178 @@
+"""
+relevance.py
+
+Cheap local pre-filter that decides which RFP chunks are worth a map LLM call.
+
+Each chunk gets two scores in [0, 1]:
+- keyword: regex hits for the fields the map prompt extracts (deadlines, items,
+  specifications, tests, services, prices) against hits for boilerplate
+  (declarations, legal terms, bidder forms), per window of the chunk;
+- embedding: how much closer windows of the chunk are to a short prototype
+  description of an extracted field than to a prototype of boilerplate, using
+  the MiniLM model the technical agent already loads.
+
+Both signals take the best window, so a schedule of requirements followed by
+pages of legal text still scores as a schedule. The chunk score is the higher
+of the two (a chunk only needs one signal to be kept). Chunks scoring below
+RELEVANCE_THRESHOLD are dropped (no map call), or only deferred to the end of
+the map stage, depending on RELEVANCE_FILTER. The first chunk is always kept:
+the title, issuer and deadline usually live on the cover pages.
+"""
+
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# CONFIG
+# "drop" skips low-scoring chunks, "defer" still maps them but after all other chunks
+# (no calls saved, earlier results for the rest), "off" maps everything.
+RELEVANCE_FILTER = os.getenv("RELEVANCE_FILTER", "drop")
+# Lower keeps more chunks (higher recall, more map calls). The default only drops chunks
+# with (almost) no field signal in any window.
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.2"))
+# Chunks are embedded in windows of this many characters (MiniLM truncates long inputs).
+EMBEDDING_WINDOW_CHARS = 1500
+# Keyword windows are smaller (and overlap by half), so a short schedule of requirements
+# isn't cancelled out by the legal text around it.
+KEYWORD_WINDOW_CHARS = 500
+# Cosine margin (field prototype minus boilerplate prototype) that scores 1; the
+# negated margin scores 0 and a tie scores 0.5.
+EMBEDDING_MARGIN = 0.1
+
+# One prototype per field group of CHUNK_MAP_PROMPT.
+FIELD_PROTOTYPES = {
+    "RFP_Metadata": "Tender notice: tender number, title of work, issuing organization or department, "
+                    "last date and time for bid submission, bid opening date.",
+    "Products_In_Scope": "Schedule of requirements: list of items, equipment or instruments to be supplied "
+                         "with quantity and units.",
+    "Key_Specifications": "Technical specifications of the equipment: range, accuracy, resolution, voltage, "
+                          "capacity, material, dimensions.",
+    "Tests_And_Standards": "Testing, inspection and compliance with IS, IEC, ISO, ASTM standards, factory "
+                           "acceptance test and site acceptance test.",
+    "Pricing_Summary": "Price bid: installation, commissioning, training, warranty, AMC, delivery and "
+                       "other services and cost drivers.",
+}
+
+# Boilerplate found in most tender bundles.
+BOILERPLATE_PROTOTYPES = [
+    "Declaration and undertaking by the bidder: I/We hereby declare, signature of bidder with seal, "
+    "name, date, place.",
+    "General terms and conditions of contract: arbitration, jurisdiction, force majeure, indemnity, "
+    "termination.",
+    "Instructions to bidders: eligibility criteria, earnest money deposit, bid security, how to submit "
+    "the online bid.",
+]
+
+# Signals that a chunk holds something the map prompt extracts.
+FIELD_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r"\b(?:tender|bid|nit|rfp|enquiry)\s*(?:no|number|ref)\b",
+    r"\b(?:last|due|closing)\s+date\b|\bsubmission\b|\bbid\s+opening\b",
+    r"\bspecifications?\b|\bspecs?\b|\btechnical\s+(?:details|requirements|parameters)\b",
+    r"\b(?:qty|quantity)\b|\b\d+\s*(?:nos?|units?|sets?)\b",
+    r"\b(?:range|accuracy|resolution|voltage|frequency|capacity|power)\s*[:\-]",
+    r"\b\d+(?:\.\d+)?\s*(?:mm|cm|kv|v|w|kw|hz|khz|mhz|a|ma|°c|kg|l|ml|bar|psi)\b",
+    r"\b(?:is|iec|iso|astm|bis|ieee|en)\s*[:\-]?\s*\d{2,5}\b",
+    r"\b(?:fat|sat|type\s+test|routine\s+test|acceptance\s+test|inspection|calibration)\b",
+    r"\b(?:installation|commissioning|training|warranty|amc|maintenance|delivery)\b",
+    r"\b(?:price|cost|rate|amount|gst|freight)\b",
+    r"\b(?:supply|procurement)\s+of\b",
+)]
+
+# Signals of boilerplate the map prompt has nothing to extract from.
+BOILERPLATE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r"\bi\s*/\s*we\b|\bhereby\b|\bundertaking\b|\bdeclaration\b|\baffidavit\b",
+    r"\bsignature\s+of\s+(?:the\s+)?(?:bidder|tenderer|authori[sz]ed)\b|\bseal\s+of\b",
+    r"\barbitration\b|\bjurisdiction\b|\bforce\s+majeure\b|\bindemnif|\bblack-?list",
+    r"\bintegrity\s+pact\b|\bpower\s+of\s+attorney\b|\bnon-?disclosure\b",
+    r"\bshall\s+not\s+be\s+liable\b|\bnotwithstanding\b|\bin\s+witness\s+whereof\b",
+)]
+
+
+class ChunkScorer:
+    """Scores chunks against the extracted fields; reusable across runs (prototype vectors are computed once)."""
+
+    def __init__(self, embeddings=None):
+        self.embeddings = embeddings
+        self._prototypes: Optional[np.ndarray] = None
+        if embeddings is not None:
+            self._prototypes = self._normalize(
+                embeddings.embed_documents(list(FIELD_PROTOTYPES.values()) + BOILERPLATE_PROTOTYPES)
+            )
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype="float32")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @staticmethod
+    def _windows(chunk: str, size: int, stride: Optional[int] = None) -> List[str]:
+        # Full-size windows; the last one ends at the end of the chunk (overlapping the
+        # one before) so a short tail can't inflate the density.
+        starts = list(range(0, max(len(chunk) - size, 0) + 1, stride or size))
+        if starts[-1] + size < len(chunk):
+            starts.append(len(chunk) - size)
+        return [chunk[i:i + size] for i in starts]
+
+    @staticmethod
+    def _window_keyword_score(window: str) -> float:
+        positive = sum(len(p.findall(window)) for p in FIELD_PATTERNS)
+        negative = sum(len(p.findall(window)) for p in BOILERPLATE_PATTERNS)
+        # Field hits per 1000 characters, discounted by boilerplate density.
+        density = 1000 * positive / max(len(window), 1)
+        penalty = 1000 * negative / max(len(window), 1)
+        return min(1.0, max(0.0, (density - penalty) / 10))
+
+    def keyword_score(self, chunk: str) -> float:
+        # The most field-like window decides, as for embedding_score.
+        windows = self._windows(chunk, KEYWORD_WINDOW_CHARS, KEYWORD_WINDOW_CHARS // 2)
+        return float(max(self._window_keyword_score(window) for window in windows))
+
+    def embedding_score(self, chunk: str) -> Optional[float]:
+        if self._prototypes is None:
+            return None
+        windows = self._windows(chunk, EMBEDDING_WINDOW_CHARS)
+        vectors = self._normalize(self.embeddings.embed_documents(windows))
+        similarities = vectors @ self._prototypes.T
+        fields = len(FIELD_PROTOTYPES)
+        # The most field-like window decides: one spec table in a chunk is enough.
+        margin = float((similarities[:, :fields].max(axis=1) - similarities[:, fields:].max(axis=1)).max())
+        return float(min(1.0, max(0.0, 0.5 + margin / (2 * EMBEDDING_MARGIN))))
+
+    def score(self, chunk: str) -> Dict[str, Any]:
+        keyword = self.keyword_score(chunk)
+        embedding = self.embedding_score(chunk)
+        combined = keyword if embedding is None else max(keyword, embedding)
+        return {"score": round(combined, 3), "keyword_score": round(keyword, 3),
+                "embedding_score": None if embedding is None else round(embedding, 3)}
+
+
+def filter_chunks(chunks: Iterable[str], scorer: ChunkScorer, filtered: List[Dict[str, Any]],
+                  mode: str = RELEVANCE_FILTER, threshold: float = RELEVANCE_THRESHOLD) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (chunk number in the document, chunk) for the chunks to map. Low-scoring
+    chunks are appended to `filtered` (with their scores, a preview and whether they
+    were "dropped" or "deferred"); in "defer" mode they are yielded after all others.
+    """
+    if mode == "off":
+        yield from enumerate(chunks, start=1)
+        return
+
+    action = "deferred" if mode == "defer" else "dropped"
+    deferred = []
+    for number, chunk in enumerate(chunks, start=1):
+        if number == 1:
+            yield number, chunk
+            continue
+        scores = scorer.score(chunk)
+        if scores["score"] >= threshold:
+            yield number, chunk
+            continue
+        filtered.append({"chunk": number, "action": action, **scores, "chars": len(chunk),
+                         "preview": re.sub(r"\s+", " ", chunk[:200]).strip()})
+        if mode == "defer":
+            deferred.append((number, chunk))
+
+    yield from deferred
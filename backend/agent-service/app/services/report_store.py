@@ -0,0 +1,86 @@
+"""
+report_store.py
+
+Optional, asynchronous persistence of the JSON reports produced by the agent
+pipelines. Pipelines hand their outputs to the next stage in memory; writing them
+to ./lib/reports is only a traceability side-effect, done on a background writer
+thread so it never sits on the critical path.
+
+Set PERSIST_REPORTS=0 to skip writing reports altogether.
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+
+import numpy as np
+
+# CONFIG
+REPORTS_DIR = "./lib/reports"
+PERSIST_REPORTS = os.getenv("PERSIST_REPORTS", "1") != "0"
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-writer")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _json_default(obj: Any):
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def write_text_atomic(path: str, text: str) -> None:
+    """Writes to a temp file next to `path`, then renames it into place."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def persist_json(path: str, data: Any, background: bool = True) -> Optional[Future]:
+    """
+    Saves `data` as JSON at `path`. The data is serialized immediately (so later
+    mutations don't leak into the file) and written on the background writer
+    unless `background` is False. No-op when PERSIST_REPORTS=0.
+    """
+    if not PERSIST_REPORTS:
+        return None
+
+    text = json.dumps(data, indent=2, ensure_ascii=False, default=_json_default)
+    if not background:
+        write_text_atomic(path, text)
+        return None
+
+    future = _writer.submit(write_text_atomic, path, text)
+    with _pending_lock:
+        _pending.add(future)
+
+    def _done(f: Future):
+        with _pending_lock:
+            _pending.discard(f)
+        if f.exception() is not None:
+            print(f"Warning: Could not save report to {path}. Error: {f.exception()}")
+
+    future.add_done_callback(_done)
+    return future
+
+
+def flush(timeout: Optional[float] = None) -> None:
+    """Blocks until every queued report has been written, or `timeout` seconds have passed."""
+    with _pending_lock:
+        pending = list(_pending)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for future in pending:
+        try:
+            future.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+        except Exception:
+            pass  # already reported by the done-callback (or still running at the deadline)
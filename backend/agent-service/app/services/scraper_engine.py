@@ -0,0 +1,265 @@
+"""
+scraper_engine.py
+
+In-process scraping engine built on playwright.async_api.
+
+A BrowserPool keeps one warm Chromium instance and a small pool of reusable
+browser contexts alive for the lifetime of the FastAPI app, so scrape requests
+skip interpreter and browser start-up and can share one browser.
+`BrowserPool.run_scrape` does the crawl (keyword + date filtering, detail pages
+opened in parallel, concurrent PDF downloads, manifest); the playwright_scraper.py
+CLI runs it on a browser launched just for that run.
+
+Usage (inside FastAPI):
+    pool = BrowserPool(headless=True)
+    await pool.start()
+    manifest = await pool.run_scrape(url, download_dir="data/raw", max_candidates=50)
+    await pool.stop()
+"""
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Route
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from crawl_state import get_crawl_state
+from playwright_scraper import (
+    DEFAULT_TIMEOUT_MS,
+    DEFAULT_WAIT_SELECTOR_LIST,
+    KEYWORDS,
+    LINK_SCAN_JS,
+    MANIFEST_PATH,
+    SCRAPER_INCREMENTAL,
+    USER_AGENT,
+    ensure_dir,
+    select_candidates,
+    download_all,
+    save_manifest,
+)
+
+# CONFIG
+DEFAULT_MAX_CONTEXTS = 4
+
+# Detail pages are crawled by URL on up to this many pages at once
+DETAIL_PAGE_CONCURRENCY = int(os.getenv("SCRAPER_DETAIL_PAGES", "6"))
+DETAIL_PAGE_TIMEOUT_MS = 10000
+
+# Requests aborted on detail pages: we only need their markup to find the PDF link
+BLOCKED_RESOURCE_TYPES = {"image", "font", "stylesheet", "media"}
+BLOCKED_URL_KEYWORDS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "facebook.net", "hotjar.com", "clarity.ms",
+]
+
+logger = logging.getLogger("scraper_engine")
+
+
+class BrowserPool:
+    """One long-lived browser plus up to `max_contexts` reusable contexts."""
+
+    def __init__(self, headless: bool = True, max_contexts: int = DEFAULT_MAX_CONTEXTS):
+        self.headless = headless
+        self.max_contexts = max(1, max_contexts)
+        self._playwright = None
+        self._browser: Optional[Browser] = None
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_contexts)
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self.running:
+                return
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            self._idle = asyncio.Queue()
+            logger.info("Browser pool started (headless=%s, max_contexts=%d).", self.headless, self.max_contexts)
+
+    async def stop(self) -> None:
+        async with self._start_lock:
+            while not self._idle.empty():
+                try:
+                    await self._idle.get_nowait().close()
+                except Exception:
+                    pass
+            if self._browser is not None:
+                await self._browser.close()
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+            logger.info("Browser pool stopped.")
+
+    @asynccontextmanager
+    async def context(self):
+        """Leases a browser context; it is wiped (pages, cookies) and returned to the pool afterwards."""
+        async with self._slots:
+            if not self.running:
+                # The browser crashed or was never started: relaunch it.
+                await self.start()
+            context: Optional[BrowserContext] = None
+            while not self._idle.empty() and context is None:
+                candidate = self._idle.get_nowait()
+                if candidate.browser is self._browser:
+                    context = candidate
+            if context is None:
+                context = await self._browser.new_context(accept_downloads=True, user_agent=USER_AGENT)
+
+            healthy = True
+            try:
+                yield context
+            except Exception:
+                healthy = False
+                raise
+            finally:
+                try:
+                    for page in list(context.pages):
+                        await page.close()
+                    await context.clear_cookies()
+                except Exception:
+                    healthy = False
+                if healthy and self.running:
+                    self._idle.put_nowait(context)
+                else:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+
+    async def run_scrape(self, start_url: str, download_dir: str, max_candidates: int,
+                         manifest_path: str = MANIFEST_PATH, incremental: bool = SCRAPER_INCREMENTAL) -> List[Dict]:
+        """
+        Scrapes `start_url` on a pooled context and writes the manifest. When `incremental`,
+        PDFs already known to the crawl state are re-checked conditionally and only new or
+        changed tenders are listed.
+        """
+        ensure_dir(download_dir)
+        manifest = []
+
+        async with self.context() as context:
+            page = await context.new_page()
+            await load_listing_page(page, start_url)
+            filtered_links = await collect_candidates(page, start_url, max_candidates)
+            logger.info(f"Found {len(filtered_links)} relevant candidates after filtering.")
+
+            resolved = await resolve_pdf_urls(context, filtered_links, DETAIL_PAGE_CONCURRENCY)
+
+        # Download all PDFs concurrently (blocking I/O, so off the event loop)
+        state = get_crawl_state() if incremental else None
+        results = await asyncio.to_thread(download_all, [pdf_url for _, pdf_url in resolved], download_dir, state=state)
+        for candidate, pdf_url in resolved:
+            result = results.get(pdf_url)
+            if not result or (incremental and result["status"] == "unchanged"):
+                continue
+            manifest.append({
+                "title": candidate["title"],
+                "pdf_url": pdf_url,
+                "download_path": result["path"],
+                "context": candidate["context"],
+                "status": result["status"]
+            })
+
+        # Deduplicate and save manifest
+        seen_urls = set()
+        final_manifest = []
+        for entry in manifest:
+            if entry["pdf_url"] not in seen_urls:
+                final_manifest.append(entry)
+                seen_urls.add(entry["pdf_url"])
+
+        save_manifest(final_manifest, manifest_path)
+        return final_manifest
+
+
+# ------------------ Page Helpers ------------------
+async def load_listing_page(page: Page, start_url: str) -> None:
+    """Navigates to the listing page and waits until it has likely rendered its tenders."""
+    try:
+        logger.info(f"Navigating to {start_url}")
+        await page.goto(start_url, wait_until="networkidle", timeout=DEFAULT_TIMEOUT_MS)
+        logger.info("Waiting for page content to load...")
+        await page.wait_for_selector(f"text=/{'|'.join(KEYWORDS)}/i", timeout=5000)
+    except Exception:
+        logger.warning("Could not find keywords on initial load, waiting for a generic selector.")
+        try:
+            await page.wait_for_selector(", ".join(DEFAULT_WAIT_SELECTOR_LIST), timeout=5000)
+        except Exception:
+            logger.warning("Generic selectors not found, proceeding after a short delay.")
+            await page.wait_for_timeout(3000)
+
+    # Scroll to load any lazy-loaded content
+    await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+    await page.wait_for_timeout(1000)
+    await page.evaluate("window.scrollTo(0, 0)")
+    await page.wait_for_timeout(500)
+
+
+async def collect_candidates(page: Page, start_url: str, max_candidates: int) -> List[Dict]:
+    """Links whose surrounding text matches the keywords and a recent date (one page.evaluate)."""
+    try:
+        links = await page.evaluate(LINK_SCAN_JS) or []
+    except Exception as e:
+        logger.error(f"Link scan failed: {e}")
+        links = []
+    logger.info(f"Found {len(links)} candidate links on the page.")
+    return select_candidates(links, start_url, max_candidates)
+
+
+async def block_heavy_resources(route: Route) -> None:
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(k in request.url for k in BLOCKED_URL_KEYWORDS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def find_detail_pdf(context: BrowserContext, detail_url: str) -> Optional[str]:
+    """Opens a detail page (without images, fonts, CSS or analytics) and returns its first PDF link."""
+    logger.info(f"Navigating to detail page: {detail_url}")
+    page = await context.new_page()
+    await page.route("**/*", block_heavy_resources)
+    try:
+        try:
+            await page.goto(detail_url, wait_until="networkidle", timeout=DETAIL_PAGE_TIMEOUT_MS)
+        except PlaywrightTimeoutError:
+            # Long-polling or slow third-party requests; look at whatever has loaded.
+            logger.warning(f"Detail page did not settle in time, using the partial page: {detail_url}")
+        pdf_link = await page.query_selector("a[href$='.pdf']")
+        if pdf_link is None:
+            logger.warning(f"No direct PDF link found on detail page: {page.url}")
+            return None
+        return urljoin(page.url, await pdf_link.get_attribute("href"))
+    except Exception as e:
+        logger.error(f"Failed to process detail page {detail_url}: {e}")
+        return None
+    finally:
+        await page.close()
+
+
+async def resolve_pdf_urls(context: BrowserContext, candidates: List[Dict],
+                           max_pages: int = DETAIL_PAGE_CONCURRENCY) -> List[Tuple[Dict, str]]:
+    """
+    (candidate, pdf_url) for every candidate that leads to a PDF. Direct PDF links are
+    used as-is; detail pages are opened by URL on at most `max_pages` pages in parallel.
+    """
+    slots = asyncio.Semaphore(max(1, max_pages))
+
+    async def resolve(candidate: Dict) -> Optional[str]:
+        href = candidate["href"]
+        if href.lower().endswith(".pdf"):
+            return href
+        async with slots:
+            return await find_detail_pdf(context, href)
+
+    pdf_urls = await asyncio.gather(*(resolve(c) for c in candidates))
+    return [(c, pdf_url) for c, pdf_url in zip(candidates, pdf_urls) if pdf_url]
@@ -1,18 +1,35 @@
 import os
 import json
+import hashlib
 import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
-from typing import Dict, Any
-from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
+
+# Vectorstore / embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_community.vectorstores import FAISS
+
+# LangChain chaining & prompts
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+# Hugging Face LLM wrappers
+from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
+
+from llm_cache import get_llm_cache
+from report_store import persist_json, flush as flush_reports
+
 # CONFIG
-TECH_OUTPUT_PATH = "./lib/reports/technical_agent_output.json"
-RFP_SUMMARY_PATH = "./lib/reports/rfp_summary.json"
-PRODUCT_PRICE_PATH = "./constants/product_prices.json"
-SERVICE_PRICE_PATH = "./constants/test_service_prices.json"
-OUTPUT_PRICING_JSON = "./lib/reports/pricing_agent_output.json"
+RFP_JSON_PATH = "./lib/reports/rfp_summary.json"
+OEM_JSON_PATH = "./constants/oem_products.json"
+OUTPUT_TECHNICAL_JSON = "./lib/reports/technical_agent_output.json"
+FAISS_INDEX_DIR = "./lib/index/oem_catalog"
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Max recommendation calls in flight (keep under the endpoint's rate limits; 1 = sequential)
+TECH_MAX_CONCURRENCY = int(os.getenv("TECH_MAX_CONCURRENCY", "4"))
+# Fast path: when rank 1 beats rank 2 by at least this many Semantic_Score points the
+# winner is decided without an LLM call. A negative value sends every item to the LLM.
+TECH_FAST_PATH_MARGIN = float(os.getenv("TECH_FAST_PATH_MARGIN", "3.0"))
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -23,140 +40,350 @@ class NumpyEncoder(json.JSONEncoder):
         if isinstance(obj, np.ndarray):
             return obj.tolist()
         return super(NumpyEncoder, self).default(obj)
-
-# LLM loader
+# 1. LLM Loader
 def llm_model():
     load_dotenv()
     api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
     if not api_token:
         raise RuntimeError("HUGGINGFACEHUB_API_TOKEN not set.")
-    llm = HuggingFaceEndpoint(
+
+    # Using the Endpoint directly is often faster/stable than Chat wrapper for pure completion,
+    # but we will stick to ChatHuggingFace as requested.
+    hf_endpoint = HuggingFaceEndpoint(
         repo_id="Qwen/Qwen2.5-Coder-32B-Instruct",
         task="text-generation",
         huggingfacehub_api_token=api_token,
-        max_new_tokens=2000,
-        temperature=0.0,  # Strict determinism
+        max_new_tokens=1500,
+        temperature=0.2,
     )
-    return ChatHuggingFace(llm=llm)
+    cache = get_llm_cache(hf_endpoint.repo_id, hf_endpoint.temperature, hf_endpoint.max_new_tokens)
+    return ChatHuggingFace(llm=hf_endpoint, cache=cache)
 
 
-def load_json(path: str):
-    if not os.path.exists(path):
+# 2. Simple JSON Loader
+def load_json(file_path: str) -> Dict[str, Any]:
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}. Returning empty dict.")
         return {}
-    with open(path, "r", encoding="utf-8") as f:
+    with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-# --- MODIFIED PROMPT FOR TOP 1 ONLY ---
-PRICING_PROMPT = PromptTemplate(
-    input_variables=[
-        "tech_json",
-        "rfp_json",
-        "product_prices_json",
-        "service_prices_json"
-    ],
-    template=(
-        "You are a deterministic Pricing Agent. You will receive technical recommendations and must generate a quote ONLY for the winning OEM.\n\n"
-
-        "INPUTS:\n"
-        "1) technical_output: Contains 'RFP_Product', 'Top_OEM', and 'Top_3_Recommendations'.\n"
-        "2) product_prices: Mapping of Model/OEM to unit prices (INR).\n"
-        "3) service_prices: Mapping of service names to prices (INR).\n"
-        "4) rfp_summary: Context on required tests.\n\n"
-
-        "TASK:\n"
-        "For each item in technical_output:\n"
-        "1. Identify the 'Top_OEM'.\n"
-        "2. Find the single object in 'Top_3_Recommendations' that belongs to this Top_OEM.\n"
-        "   - If 'Top_3_Recommendations' is empty, return 'Status': 'No Technical Match Found'.\n"
-        "3. Compute pricing for ONLY this single winning item.\n"
-        "   - Base Price: Lookup Model > Product_Type > OEM in product_prices.\n"
-        "   - Services: Add 'Installation', 'Commissioning', 'FAT', 'SAT' costs from service_prices.\n"
-        "   - Total: Base Price + Services.\n"
-        "4. If price is missing, use 'To Be Quoted'.\n\n"
-
-        "STRICT OUTPUT JSON SCHEMA:\n"
-        "{{\n"
-        "  \"Pricing_Summary\": [\n"
-        "    {{\n"
-        "      \"RFP_Product\": \"<string>\",\n"
-        "      \"Winning_OEM\": \"<string>\",\n"
-        "      \"Winning_Quote\": {{\n"
-        "          \"Model\": \"<string>\",\n"
-        "          \"Unit_Price_INR\": <int or 'To Be Quoted'>,\n"
-        "          \"Services_Cost_INR\": <int>,\n"
-        "          \"Applied_Services\": [\"FAT\", \"SAT\", ...],\n"
-        "          \"Total_Item_Cost\": <int or 'To Be Quoted'>\n"
-        "      }}\n"
-        "    }}\n"
-        "  ],\n"
-        "  \"Grand_Total_INR\": <int>\n"
-        "}}\n\n"
-
-        "DATA:\n"
-        "TECHNICAL_OUTPUT:\n{tech_json}\n\n"
-        "PRODUCT_PRICES:\n{product_prices_json}\n\n"
-        "SERVICE_PRICES:\n{service_prices_json}\n\n"
-        "RFP_SUMMARY:\n{rfp_json}\n\n"
-
-        "Return ONLY valid JSON. No markdown."
+# 3. Build FAISS Index
+def embedding_model():
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+def product_text(prod: Dict[str, Any]) -> str:
+    return (
+            f"{prod.get('Product_Type', '')} by {prod.get('OEM', '')}, Model {prod.get('Model', '')}. "
+            + " ".join(f"{k}: {v}." for k, v in prod.get("Specs", {}).items())
     )
-)
 
 
-def pricing_agent_llm_pipeline():
-    print("Running Top-1 Pricing Agent...")
+def product_id(prod: Dict[str, Any]) -> str:
+    """Content hash of a catalog entry; any change to the product yields a new id."""
+    return hashlib.sha256(json.dumps(prod, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def catalog_fingerprint(ids: List[str]) -> str:
+    return hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+
+def write_catalog_manifest(manifest_path: str, fingerprint: str, ids: List[str]):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "fingerprint": fingerprint,
+            "ids": ids,
+        }, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def build_faiss_index(oem_products: List[Dict[str, Any]], embeddings=None, index_dir: str = FAISS_INDEX_DIR):
+    """
+    Loads the persisted catalog index from `index_dir` and brings it in line with
+    `oem_products`: only added/changed products are embedded and deleted ones are
+    removed. Falls back to a full build when there is no usable index on disk. What to
+    add or remove is decided from the ids stored in the index; the manifest only
+    records which embedding model built it.
+    """
+    if not oem_products:
+        print("No OEM products found to index.")
+        return None
+
+    embeddings = embeddings or embedding_model()
+
+    # Identical duplicate entries collapse onto one id.
+    catalog: Dict[str, Dict[str, Any]] = {}
+    for prod in oem_products:
+        catalog.setdefault(product_id(prod), prod)
+    fingerprint = catalog_fingerprint(list(catalog))
+
+    manifest_path = os.path.join(index_dir, "catalog_manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    db = None
+    if manifest.get("embedding_model") == EMBEDDING_MODEL_NAME and os.path.exists(os.path.join(index_dir, "index.faiss")):
+        try:
+            # The docstore pickle is written by this module only.
+            db = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            print(f"Could not load FAISS index from {index_dir}, rebuilding. Error: {e}")
+            db = None
+
+    # The index itself is authoritative; the manifest may be stale if its write failed.
+    stored_ids = set(db.index_to_docstore_id.values()) if db is not None else set()
+    if db is not None and stored_ids == set(catalog):
+        print(f"OEM index up to date ({len(catalog)} products).")
+        if manifest.get("fingerprint") != fingerprint:
+            write_catalog_manifest(manifest_path, fingerprint, list(catalog))
+        return db
+
+    if db is None:
+        print(f"Building OEM index from scratch ({len(catalog)} products)...")
+        ids = list(catalog)
+        db = FAISS.from_texts(
+            [product_text(catalog[i]) for i in ids],
+            embedding=embeddings,
+            metadatas=[catalog[i] for i in ids],
+            ids=ids,
+        )
+    else:
+        removed = [i for i in stored_ids if i not in catalog]
+        added = [i for i in catalog if i not in stored_ids]
+        print(f"Updating OEM index: +{len(added)} / -{len(removed)} products.")
+        if removed:
+            db.delete(removed)
+        if added:
+            db.add_texts(
+                [product_text(catalog[i]) for i in added],
+                metadatas=[catalog[i] for i in added],
+                ids=added,
+            )
+
+    os.makedirs(index_dir, exist_ok=True)
+    db.save_local(index_dir)
+    write_catalog_manifest(manifest_path, fingerprint, list(catalog))
+    return db
+
+
+# 4. Semantic Match Logic
+def _match_from_doc(doc, raw_score) -> Dict[str, Any]:
+    # Simple conversion: L2 distance to a generic 0-100 score
+    # Note: This is a rough heuristic. Lower L2 = Higher Similarity.
+    # Assuming raw_score is L2 distance.
+    similarity_score = max(0, 100 - (float(raw_score) * 10))
+
+    meta = doc.metadata
+    return {
+        "OEM": meta.get("OEM"),
+        "Model": meta.get("Model"),
+        "Product_Type": meta.get("Product_Type"),
+        "Specs": meta.get("Specs"),
+        "Semantic_Score": round(similarity_score, 2)
+    }
+
 
-    tech = load_json(TECH_OUTPUT_PATH)
-    rfp = load_json(RFP_SUMMARY_PATH)
-    product_prices = load_json(PRODUCT_PRICE_PATH)
-    service_prices = load_json(SERVICE_PRICE_PATH)
+def find_top_matches(db, query: str, top_k: int = 5):
+    if db is None:
+        return []
 
-    # Check if tech output is valid
-    if not tech or "RFP_Technical_Recommendations" not in tech:
-        print("Error: technical_agent_output.json is missing or invalid.")
-        return
+    try:
+        # FAISS default is L2 distance (lower is better)
+        results_with_scores = db.similarity_search_with_score(query, k=top_k)
+        return [_match_from_doc(doc, raw_score) for doc, raw_score in results_with_scores]
+
+    except Exception as e:
+        print(f"Error in vector search: {e}")
+        return []
+
+
+def batch_search(db, queries: List[str], top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Embeds all queries in one embed_documents call and runs a single FAISS search.
+    Returns (distances, indices), both of shape (len(queries), k); index -1 marks an empty slot.
+    """
+    vectors = np.asarray(db.embeddings.embed_documents(list(queries)), dtype=np.float32)
+    if getattr(db, "_normalize_L2", False):
+        import faiss
+        faiss.normalize_L2(vectors)
+    k = min(top_k, db.index.ntotal)
+    return db.index.search(vectors, k)
 
-    # Prepare inputs
-    tech_str = json.dumps(tech, indent=2, ensure_ascii=False, cls=NumpyEncoder)
-    rfp_str = json.dumps(rfp, indent=2, ensure_ascii=False, cls=NumpyEncoder)
-    prod_prices_str = json.dumps(product_prices, indent=2, ensure_ascii=False, cls=NumpyEncoder)
-    svc_prices_str = json.dumps(service_prices, indent=2, ensure_ascii=False, cls=NumpyEncoder)
 
-    llm = llm_model()
-    chain = PRICING_PROMPT | llm | StrOutputParser()
+def find_top_matches_batch(db, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+    """Batched find_top_matches: one list of matches per query, in query order."""
+    if db is None or not queries:
+        return [[] for _ in queries]
 
-    print("Calculations in progress...")
     try:
-        llm_response = chain.invoke({
-            "tech_json": tech_str,
-            "rfp_json": rfp_str,
-            "product_prices_json": prod_prices_str,
-            "service_prices_json": svc_prices_str
-        })
+        distances, indices = batch_search(db, queries, top_k=top_k)
+    except Exception as e:
+        print(f"Error in batched vector search: {e}")
+        return [[] for _ in queries]
 
-        # Clean potential markdown wrappers
-        cleaned_response = llm_response.replace("```json", "").replace("```", "").strip()
+    all_matches = []
+    for row_distances, row_indices in zip(distances, indices):
+        matches = []
+        for raw_score, idx in zip(row_distances, row_indices):
+            if idx == -1:
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[int(idx)])
+            matches.append(_match_from_doc(doc, raw_score))
+        all_matches.append(matches)
+    return all_matches
 
-        parsed = json.loads(cleaned_response)
 
-        # Validation
-        if "Grand_Total_INR" not in parsed:
-            parsed["Grand_Total_INR"] = 0
+# 5. Prompt Definition
+TECH_PROMPT = PromptTemplate(
+    input_variables=["product_name", "matches"],
+    template=(
+        "You are a TECHNICAL AGENT.\n"
+        "Input RFP product: {product_name}\n\n"
+        "Analyze the matches below and select the best fit based on specs.\n"
+        "Matches (raw JSON list):\n{matches}\n\n"
+        "Provide ONLY valid JSON output with the following keys:\n"
+        " - RFP_Product (string)\n"
+        " - Top_3_Recommendations (list of objects with OEM, Model, Product_Type, Specs, Semantic_Score)\n"
+        " - Top_OEM (string: OEM of the highest Semantic_Score)\n\n"
+        "Do not include Markdown formatting (like ```json). Return only the raw JSON string."
+    )
+)
 
-        with open(OUTPUT_PRICING_JSON, "w", encoding="utf-8") as f:
-            json.dump(parsed, f, indent=2, ensure_ascii=False)
 
-        print(f"✅ Pricing complete. Quote generated for Top OEMs only -> {OUTPUT_PRICING_JSON}")
-        return parsed
+# 6. Recommendation Generation
+def build_recommendation(product: str, matches: List[Dict[str, Any]], llm_output) -> Dict[str, Any]:
+    """Turns one LLM response (or the exception it raised) into a recommendation entry."""
+    if isinstance(llm_output, Exception):
+        print(f"  - Pipeline Error ({product}): {llm_output}")
+        return {"RFP_Product": product, "Error": str(llm_output)}
+
+    try:
+        # Clean string if LLM adds markdown blocks
+        clean_output = llm_output.replace("```json", "").replace("```", "").strip()
+        parsed = json.loads(clean_output)
+
+        return {
+            "RFP_Product": parsed.get("RFP_Product", product),
+            "Top_3_Recommendations": parsed.get("Top_3_Recommendations", matches[:3]),
+            "Top_OEM": parsed.get("Top_OEM", matches[0]["OEM"] if matches else "Unknown"),
+            "Decision_Source": "llm"
+        }
 
     except json.JSONDecodeError:
-        print("❌ LLM output was not valid JSON.")
-        # Save raw output for debugging
-        with open("pricing_debug.txt", "w", encoding="utf-8") as f:
-            f.write(llm_response)
-        raise
+        print(f"  - LLM JSON Error ({product}). Using deterministic fallback.")
+        return {
+            "RFP_Product": product,
+            "Top_3_Recommendations": matches[:3],
+            "Top_OEM": matches[0]["OEM"] if matches else "Unknown",
+            "Decision_Source": "fallback",
+            "Note": "Fallback due to LLM parsing error"
+        }
+    except Exception as e:
+        print(f"  - Pipeline Error ({product}): {e}")
+        return {"RFP_Product": product, "Error": str(e)}
+
+
+def decide_by_score(product: str, matches: List[Dict[str, Any]],
+                    margin: float = TECH_FAST_PATH_MARGIN) -> Optional[Dict[str, Any]]:
+    """
+    Deterministic recommendation for clear winners: the top match wins outright when
+    it leads rank 2 by at least `margin` points. Returns None when there is nothing to
+    compare (no or a single match) or the lead is smaller, so those go to the LLM.
+    """
+    if margin < 0 or len(matches) < 2:
+        return None
+
+    if matches[0]["Semantic_Score"] - matches[1]["Semantic_Score"] < margin:
+        return None
+
+    return {
+        "RFP_Product": product,
+        "Top_3_Recommendations": matches[:3],
+        "Top_OEM": matches[0]["OEM"],
+        "Decision_Source": "score",
+        "Note": "Decided by Semantic_Score margin (no LLM call)"
+    }
+
+
+def recommend_products(chain, products: List[str], all_matches: List[List[Dict[str, Any]]],
+                       max_concurrency: int = TECH_MAX_CONCURRENCY,
+                       fast_path_margin: float = TECH_FAST_PATH_MARGIN) -> List[Dict[str, Any]]:
+    """
+    Decides clear winners by score and runs the recommendation chain concurrently for
+    the ambiguous rest; output follows `products` order.
+    """
+    results: List[Optional[Dict[str, Any]]] = [
+        decide_by_score(product, matches, fast_path_margin)
+        for product, matches in zip(products, all_matches)
+    ]
+    ambiguous = [i for i, result in enumerate(results) if result is None]
+    print(f"{len(results) - len(ambiguous)} product(s) decided by score, {len(ambiguous)} sent to the LLM.")
+    if not ambiguous:
+        return results
+
+    inputs = [
+        {
+            "product_name": products[i],
+            "matches": json.dumps(all_matches[i], indent=2, ensure_ascii=False, cls=NumpyEncoder)
+        }
+        for i in ambiguous
+    ]
+    print(f"Generating recommendations for {len(ambiguous)} product(s) (max {max_concurrency} in flight)...")
+    llm_outputs = chain.batch(inputs, config={"max_concurrency": max(1, max_concurrency)}, return_exceptions=True)
+
+    for i, llm_output in zip(ambiguous, llm_outputs):
+        results[i] = build_recommendation(products[i], all_matches[i], llm_output)
+    return results
+
+
+# 7. Main Pipeline
+def technical_agent_pipeline(llm=None, db=None, rfp: Optional[Dict[str, Any]] = None,
+                             output_path: Optional[str] = OUTPUT_TECHNICAL_JSON):
+    """
+    Builds RFP_Technical_Recommendations for `rfp` (read from RFP_JSON_PATH when not
+    given). The result is returned and saved to `output_path` in the background unless that is None.
+    """
+    print("Initializing Technical Agent...")
+    llm = llm or llm_model()
+
+    # Load Data
+    if rfp is None:
+        rfp = load_json(RFP_JSON_PATH)
+
+    # Build Vector DB (unless a prebuilt index was injected)
+    if db is None:
+        oems = load_json(OEM_JSON_PATH)  # Expecting a list of dicts directly, or a dict containing a list
+        if isinstance(oems, dict) and "products" in oems: oems = oems["products"]
+        db = build_faiss_index(oems)
+
+    products_in_scope = rfp.get("Technical_Summary", {}).get("Products_In_Scope", [])
+
+    # Initialize Chain (Using LCEL)
+    # Prompt -> LLM -> String Output Parser
+    chain = TECH_PROMPT | llm | StrOutputParser()
+
+    # 1. Retrieve Matches (one embedding pass + one FAISS search for all products)
+    all_matches = find_top_matches_batch(db, products_in_scope, top_k=5)
+
+    # 2. Generate Recommendations
+    results = recommend_products(chain, products_in_scope, all_matches)
+
+    # Output
+    final_output = {"RFP_Technical_Recommendations": results}
+
+    if output_path:
+        persist_json(output_path, final_output)
+
+    print(f"Technical Agent done.{f' Output saved to -> {output_path}' if output_path else ''}")
+    return final_output
 
 
 if __name__ == "__main__":
-    pricing_agent_llm_pipeline()
\ No newline at end of file
+    technical_agent_pipeline()
+    flush_reports()
\ No newline at end of file
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The services import each other by module name (as when run from services/).
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services")
+if SERVICES_DIR not in sys.path:
+    sys.path.insert(0, SERVICES_DIR)
@@ -0,0 +1,76 @@
+import json
+import random
+
+from chunking import iter_content_defined_chunks
+from llm_cache import ChunkOutputCache, ResponseStore
+from main_agent_module import CachedMapChain
+
+WORDS = ("supply of rain gauge with accuracy range voltage installation warranty "
+         "delivery quantity tender the of and").split()
+
+
+def make_pages(count=60, lines_per_page=40, seed=1):
+    rng = random.Random(seed)
+    pages = []
+    for p in range(count):
+        lines = [f"SECTION {p}"] if p % 10 == 0 else []
+        lines += [" ".join(rng.choice(WORDS) for _ in range(12)) + f" {p}.{i}" for i in range(lines_per_page)]
+        lines.append(f"Page {p + 1} of {count}")
+        pages.append("\n".join(lines))
+    return pages
+
+
+def estimate(text):
+    return max(1, len(text) // 4)
+
+
+class CountingChain:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, payload):
+        self.calls += 1
+        return json.dumps({"chars": len(payload["chunk_text"])})
+
+
+def chunks_of(pages):
+    return list(iter_content_defined_chunks(pages, token_budget=2000, count=estimate))
+
+
+def test_inserted_page_reuses_unchanged_chunks():
+    original = make_pages()
+    revised = original[:25] + ["CORRIGENDUM\n" + "\n".join(f"Revised clause {i} supply of gauge" for i in range(30))]
+    revised += original[25:]
+    # Page numbers shift after the inserted page.
+    revised = [page.rsplit("\n", 1)[0] + f"\nPage {i + 1} of {len(revised)}" for i, page in enumerate(revised)]
+
+    cache = ChunkOutputCache(ResponseStore(":memory:"), ["model", 0.3, 2000, "prompt"])
+    first = CachedMapChain(CountingChain(), cache)
+    for chunk in chunks_of(original):
+        first.invoke({"chunk_text": chunk})
+
+    revised_chunks = chunks_of(revised)
+    second = CachedMapChain(CountingChain(), cache)
+    for chunk in revised_chunks:
+        second.invoke({"chunk_text": chunk})
+
+    assert len(revised_chunks) >= 8
+    assert second.reused >= len(revised_chunks) - 3
+    assert second.chain.calls == len(revised_chunks) - second.reused
+
+
+def test_invalid_json_is_not_stored():
+    class BadChain:
+        def invoke(self, payload):
+            return "not json"
+
+    cache = ChunkOutputCache(ResponseStore(":memory:"), ["model"])
+    CachedMapChain(BadChain(), cache).invoke({"chunk_text": "text"})
+    assert cache.get("text") is None
+
+
+def test_chunk_outputs_are_namespaced_by_model_and_prompt():
+    store = ResponseStore(":memory:")
+    ChunkOutputCache(store, ["model-a", "prompt"]).put("text", "{}")
+    assert ChunkOutputCache(store, ["model-b", "prompt"]).get("text") is None
+    assert ChunkOutputCache(store, ["model-a", "prompt"]).get("text") == "{}"
@@ -0,0 +1,44 @@
+from chunking import iter_token_chunks
+
+BODY = "alpha beta gamma delta"  # 4 words + newline = 5 "tokens"
+
+
+def words(text):
+    return len(text.split())
+
+
+def chunks(pages, budget):
+    return list(iter_token_chunks(pages, budget, count=words))
+
+
+def test_full_chunk_is_cut_before_its_last_heading():
+    page = "\n".join([BODY, BODY, "SECTION 2", BODY, BODY])
+    assert chunks([page], 20) == ["\n".join([BODY, BODY]), "\n".join(["SECTION 2", BODY, BODY])]
+
+
+def test_heading_too_early_falls_back_to_line_boundary():
+    # Cutting before "SECTION 2" would leave the chunk less than half full.
+    page = "\n".join([BODY, "SECTION 2", BODY, BODY, BODY, BODY])
+    assert chunks([page], 20) == ["\n".join([BODY, "SECTION 2", BODY, BODY]), "\n".join([BODY, BODY])]
+
+
+def test_line_longer_than_budget_is_split():
+    long_line = " ".join(f"word{i}" for i in range(35)) + "."
+    result = chunks(["\n".join([BODY, long_line, BODY])], 10)
+
+    assert result[0] == BODY
+    assert all(words(chunk) <= 10 for chunk in result)
+    assert " ".join(result).split() == (BODY + " " + long_line + " " + BODY).split()
+
+
+def test_chunks_never_exceed_budget_and_keep_all_text():
+    pages = []
+    for p in range(6):
+        lines = [f"{p + 1}.{i} Scope item {i}" if i % 4 == 0 else " ".join(["spec"] * (i % 7 + 1)) for i in range(30)]
+        pages.append("\n".join(lines))
+
+    for budget in (12, 25, 60):
+        result = chunks(pages, budget)
+        for chunk in result:
+            assert sum(words(line) + 1 for line in chunk.split("\n")) <= budget
+        assert " ".join(result).split() == " ".join(pages).split()
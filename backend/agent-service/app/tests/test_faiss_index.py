@@ -0,0 +1,42 @@
+import json
+import os
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from technical_agent_module import build_faiss_index, product_id
+
+PRODUCTS = [
+    {"OEM": "Acme", "Model": "RG-200", "Product_Type": "Rain Gauge", "Specs": {"Capacity": "200 mm"}},
+    {"OEM": "Acme", "Model": "EV-10", "Product_Type": "Evaporimeter", "Specs": {"Range": "0-100 mm"}},
+]
+NEW_PRODUCT = {"OEM": "Zen", "Model": "WS-5", "Product_Type": "Weather Station", "Specs": {"Sensors": "5"}}
+
+
+def stored_ids(db):
+    return set(db.index_to_docstore_id.values())
+
+
+def test_incremental_update(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    db = build_faiss_index(PRODUCTS, embeddings, index_dir=str(tmp_path))
+    assert stored_ids(db) == {product_id(p) for p in PRODUCTS}
+
+    db = build_faiss_index(PRODUCTS[1:] + [NEW_PRODUCT], embeddings, index_dir=str(tmp_path))
+    assert stored_ids(db) == {product_id(PRODUCTS[1]), product_id(NEW_PRODUCT)}
+
+
+def test_stale_manifest_does_not_duplicate_ids(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    build_faiss_index(PRODUCTS + [NEW_PRODUCT], embeddings, index_dir=str(tmp_path))
+
+    # The index was saved but the manifest still describes an older catalog.
+    manifest_path = os.path.join(tmp_path, "catalog_manifest.json")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.update(fingerprint="stale", ids=[product_id(PRODUCTS[0])])
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    db = build_faiss_index(PRODUCTS + [NEW_PRODUCT], embeddings, index_dir=str(tmp_path))
+    assert stored_ids(db) == {product_id(p) for p in PRODUCTS + [NEW_PRODUCT]}
+    assert db.index.ntotal == 3
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import (JobManager, QueueFullError, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING,
+                       JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED)
+
+
+class StubRunner:
+    """Runs until released; fails for payloads with "fail", otherwise returns the payload."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+
+    def __call__(self, job):
+        self.started.release()
+        job.update_progress(node="Main_Agent")
+        assert self.release.wait(5)
+        if job.payload.get("fail"):
+            raise RuntimeError("PDF could not be parsed")
+        return {"echo": job.payload}
+
+
+def wait_until_finished(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.finished
+
+
+@pytest.fixture
+def runner():
+    runner = StubRunner()
+    yield runner
+    runner.release.set()
+
+
+def test_status_transitions_and_result(runner):
+    manager = JobManager(runner, max_workers=1)
+    job = manager.submit({"pdf_path": "a.pdf"})
+    assert runner.started.acquire(timeout=5)
+    assert job.status == JOB_STATUS_RUNNING
+    assert job.to_dict()["progress"] == {"node": "Main_Agent"}
+
+    runner.release.set()
+    wait_until_finished(job)
+    data = manager.get(job.id).to_dict()
+    assert data["status"] == JOB_STATUS_SUCCEEDED
+    assert data["result"] == {"echo": {"pdf_path": "a.pdf"}}
+    assert data["error"] is None
+    assert data["created_at"] <= data["started_at"] <= data["finished_at"]
+    manager.shutdown(wait=True)
+
+
+def test_failed_job_records_the_error(runner):
+    manager = JobManager(runner, max_workers=1)
+    runner.release.set()
+    job = manager.submit({"fail": True})
+    wait_until_finished(job)
+    assert job.status == JOB_STATUS_FAILED
+    assert job.error == "PDF could not be parsed"
+    assert job.to_dict(include_result=False).keys() >= {"job_id", "status", "error"}
+    assert "result" not in job.to_dict(include_result=False)
+    manager.shutdown(wait=True)
+
+
+def test_queue_full_is_rejected(runner):
+    manager = JobManager(runner, max_workers=1, max_queued=2)
+    running = manager.submit({"n": 0})
+    assert runner.started.acquire(timeout=5)
+    queued = [manager.submit({"n": i}) for i in (1, 2)]
+    assert [job.status for job in queued] == [JOB_STATUS_QUEUED, JOB_STATUS_QUEUED]
+
+    with pytest.raises(QueueFullError):
+        manager.submit({"n": 3})
+
+    runner.release.set()
+    for job in [running] + queued:
+        wait_until_finished(job)
+    # Room again once the queue has drained.
+    wait_until_finished(manager.submit({"n": 4}))
+    manager.shutdown(wait=True)
+
+
+def test_old_finished_jobs_are_forgotten(runner):
+    runner.release.set()
+    manager = JobManager(runner, max_workers=1, history_limit=2)
+    jobs = []
+    for i in range(4):
+        jobs.append(manager.submit({"n": i}))
+        wait_until_finished(jobs[-1])
+    manager.submit({"n": 4})  # pruning happens on submit
+    assert [manager.get(job.id) is not None for job in jobs] == [False, False, True, True]
+    manager.shutdown(wait=True)
+
+
+def test_unknown_job():
+    manager = JobManager(lambda job: None)
+    assert manager.get("missing") is None
+    manager.shutdown()
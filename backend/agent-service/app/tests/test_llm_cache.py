@@ -0,0 +1,98 @@
+import json
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+import llm_cache
+from llm_cache import ResponseCache, ResponseStore
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    store = ResponseStore(":memory:", ttl_s=60, max_entries=0)
+    store.put("k", "ns", "v")
+
+    clock.now += 59
+    assert store.get("k") == "v"
+    clock.now += 2
+    assert store.get("k") is None
+
+    store.evict()
+    assert store.stats()["entries"] == 0
+    assert (store.stats()["hits"], store.stats()["misses"]) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    store = ResponseStore(":memory:", ttl_s=0, max_entries=2)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        store.put(key, "ns", key)
+    clock.now += 1
+    store.get("a")  # "b" is now the least recently used
+
+    store.evict()
+    assert [store.get(key) for key in ("a", "b", "c")] == ["a", None, "c"]
+
+
+def test_key_depends_on_model_configuration_and_prompt():
+    store = ResponseStore(":memory:")
+    qwen = ResponseCache(store, "Qwen/Qwen2.5-Coder-32B-Instruct", 0.3, 2000)
+    qwen.update("prompt", "llm-string-1", [Generation(text='{"answer": 1}')])
+
+    # llm_string is not part of the key ...
+    assert qwen.lookup("prompt", "llm-string-2")[0].text == '{"answer": 1}'
+    # ... but the prompt and every part of the model configuration are.
+    assert qwen.lookup("other prompt", "llm-string-1") is None
+    for other in (ResponseCache(store, "Qwen/Qwen2.5-Coder-32B-Instruct", 0.0, 2000),
+                  ResponseCache(store, "Qwen/Qwen2.5-Coder-32B-Instruct", 0.3, 1000),
+                  ResponseCache(store, "meta-llama/Llama-3.1-8B-Instruct", 0.3, 2000)):
+        assert other.lookup("prompt", "llm-string-1") is None
+
+
+def test_chat_generations_round_trip():
+    cache = ResponseCache(ResponseStore(":memory:"), "repo", 0.3, 2000)
+    cache.update("prompt", "", [ChatGeneration(message=AIMessage(content=json.dumps({"a": 1})))])
+    generation = cache.lookup("prompt", "")[0]
+    assert isinstance(generation, ChatGeneration)
+    assert json.loads(generation.message.content) == {"a": 1}
+
+
+def test_clear_only_drops_its_namespace():
+    store = ResponseStore(":memory:")
+    first, second = ResponseCache(store, "a", 0.3, 10), ResponseCache(store, "b", 0.3, 10)
+    first.update("p", "", [Generation(text="1")])
+    second.update("p", "", [Generation(text="2")])
+    first.clear()
+    assert first.lookup("p", "") is None
+    assert second.lookup("p", "")[0].text == "2"
+
+
+def test_only_json_responses_are_stored():
+    cache = ResponseCache(ResponseStore(":memory:"), "repo", 0.3, 2000)
+    cache.update("prompt", "", [Generation(text="not json")])
+    assert cache.lookup("prompt", "") is None
+
+    cache.update("prompt", "", [Generation(text='```json\n{"a": 1}\n```')])
+    assert cache.lookup("prompt", "")[0].text == '```json\n{"a": 1}\n```'
+
+
+def test_chat_model_retries_after_invalid_json():
+    from langchain_core.language_models import FakeListChatModel
+
+    model = FakeListChatModel(responses=["not json", '{"a": 1}', '{"a": 2}'],
+                              cache=ResponseCache(ResponseStore(":memory:"), "repo", 0.3, 2000))
+    assert model.invoke("prompt").content == "not json"
+    assert model.invoke("prompt").content == '{"a": 1}'
+    # The valid answer is now served from the cache.
+    assert model.invoke("prompt").content == '{"a": 1}'
@@ -0,0 +1,70 @@
+import json
+import time
+import threading
+
+import pytest
+
+from main_agent_module import Prefetch, invoke_json_bounded, iter_chunks
+
+
+class SlowChain:
+    """Chain stub: returns {"n": payload} after `delay` seconds (or never, for payloads in `hang`)."""
+
+    def __init__(self, delay=0.0, hang=()):
+        self.delay = delay
+        self.hang = set(hang)
+        self.release = threading.Event()
+
+    def invoke(self, payload):
+        if payload in self.hang:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        return json.dumps({"n": payload})
+
+
+def test_prefetch_reraises_producer_errors():
+    def items():
+        yield 1
+        raise ValueError("boom")
+
+    source = Prefetch(items(), 2)
+    assert next(source) == 1
+    with pytest.raises(ValueError):
+        next(source)
+
+
+def test_results_come_back_in_input_order():
+    results = invoke_json_bounded(SlowChain(0.01), range(10), max_concurrency=3, call_timeout=5, prefetch_size=4)
+    assert results == [{"n": i} for i in range(10)]
+
+
+def test_slow_inputs_do_not_hold_up_timeouts_or_results():
+    settled = {}
+    start = time.monotonic()
+
+    def slow_inputs():
+        yield 0
+        yield 1
+        time.sleep(1.0)  # e.g. the rest of the PDF is still being parsed
+        yield 2
+
+    chain = SlowChain(hang={0})
+    results = invoke_json_bounded(
+        chain, slow_inputs(), max_concurrency=4, call_timeout=0.2, prefetch_size=2,
+        on_result=lambda idx, result: settled.setdefault(idx, time.monotonic() - start),
+    )
+    chain.release.set()
+
+    assert results == [None, {"n": 1}, {"n": 2}]
+    # Input 1 finished and input 0 timed out while input 2 was still being produced.
+    assert settled[1] < 0.5
+    assert settled[0] < 0.8
+    assert settled[2] >= 1.0
+
+
+def test_iter_chunks_respects_size_and_covers_text():
+    pages = [" ".join(f"page{p}word{i}" for i in range(300)) for p in range(8)]
+    chunks = list(iter_chunks(pages, chunk_size=1000, chunk_overlap=100))
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    joined = " ".join(chunks)
+    assert all(f"page{p}word{i}" in joined for p in range(8) for i in range(0, 300, 7))
@@ -0,0 +1,64 @@
+import pytest
+from langchain_core.language_models import FakeListChatModel
+
+import final
+from pricing_agent_module import PriceBook
+
+PRODUCTS = ["Rain gauge 200 mm", "Evaporimeter"]
+MATCHES = {
+    "Rain gauge 200 mm": [
+        {"OEM": "Acme", "Model": "RG-200", "Product_Type": "Rain Gauge", "Specs": {}, "Semantic_Score": 90.0},
+        {"OEM": "Zen", "Model": "RG-9", "Product_Type": "Rain Gauge", "Specs": {}, "Semantic_Score": 60.0},
+    ],
+    "Evaporimeter": [
+        {"OEM": "Zen", "Model": "EV-10", "Product_Type": "Evaporimeter", "Specs": {}, "Semantic_Score": 80.0},
+        {"OEM": "Acme", "Model": "EV-1", "Product_Type": "Evaporimeter", "Specs": {}, "Semantic_Score": 50.0},
+    ],
+}
+
+
+class StubRegistry:
+    oem_index = object()
+    technical_llm = FakeListChatModel(responses=["{}"])  # every product above is decided by score
+    price_book = PriceBook({"RG-200": 1000, "EV-10": 2500.0}, {})
+    main_llm = None
+    chunk_scorer = None
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    searches = []
+
+    def find_top_matches_batch(db, queries, top_k=5):
+        searches.append(list(queries))
+        return [MATCHES[q] for q in queries]
+
+    def main_agent_pipeline(**kwargs):
+        return {"RFP_Metadata": {"Tender_ID": "T-1"}, "Technical_Summary": {"Products_In_Scope": PRODUCTS}}
+
+    monkeypatch.setattr(final, "get_registry", lambda: StubRegistry())
+    monkeypatch.setattr(final, "find_top_matches_batch", find_top_matches_batch)
+    monkeypatch.setattr(final, "main_agent_pipeline", main_agent_pipeline)
+    monkeypatch.setattr(final, "PRICING_MODE", "engine")
+    return final.build_parallel_flow().compile(), searches
+
+
+def test_products_are_retrieved_in_one_batch(graph, tmp_path):
+    app, searches = graph
+    state = app.invoke({"pdf_path": "rfp.pdf", "report_dir": str(tmp_path)})
+    final.flush_reports()
+
+    assert searches == [PRODUCTS]
+    recommendations = state["technical_output"]["RFP_Technical_Recommendations"]
+    assert [r["Top_OEM"] for r in recommendations] == ["Acme", "Zen"]
+    assert state["final_response"]["Grand_Total_INR"] == 3500
+
+
+def test_no_products_skips_retrieval(graph, tmp_path, monkeypatch):
+    app, searches = graph
+    monkeypatch.setattr(final, "main_agent_pipeline", lambda **kwargs: {"Technical_Summary": {"Products_In_Scope": []}})
+    state = app.invoke({"pdf_path": "rfp.pdf", "report_dir": str(tmp_path)})
+    final.flush_reports()
+
+    assert searches == []
+    assert state["final_response"]["Technical_Recommendations"] == []
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+import pdf_text
+
+
+def write_pdf(path, texts):
+    """Minimal PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+    return str(path)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setattr(pdf_text, "PDF_TEXT_CACHE_DIR", str(path))
+    monkeypatch.setattr(pdf_text, "PDF_TEXT_CACHE_ENABLED", True)
+    return path
+
+
+def fail_extraction(*args, **kwargs):
+    raise AssertionError("the PDF should have been served from the cache")
+
+
+def test_second_read_is_served_from_cache(tmp_path, cache_dir, monkeypatch):
+    pdf = write_pdf(tmp_path / "rfp.pdf", ["Scope of supply", "Rain gauge 200 mm"])
+    assert pdf_text.extract_pages(pdf) == ["Scope of supply", "Rain gauge 200 mm"]
+
+    # An identical copy under another name hits the same entry.
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(open(pdf, "rb").read())
+    monkeypatch.setattr(pdf_text, "_extract_in_order", fail_extraction)
+    assert pdf_text.extract_pages(str(copy)) == ["Scope of supply", "Rain gauge 200 mm"]
+
+
+def test_other_pypdf_version_is_re_extracted(tmp_path, cache_dir):
+    pdf = write_pdf(tmp_path / "rfp.pdf", ["Scope of supply"])
+    pdf_text.extract_pages(pdf)
+    [entry] = list(cache_dir.iterdir())
+    lines = entry.read_text(encoding="utf-8").splitlines()
+    entry.write_text("\n".join([json.dumps({"pypdf_version": "0.0.1"}), json.dumps("stale text")]) + "\n",
+                     encoding="utf-8")
+
+    assert pdf_text.iter_cached_pages(entry.stem) is None
+    assert pdf_text.extract_pages(pdf) == ["Scope of supply"]
+    assert entry.read_text(encoding="utf-8").splitlines() == lines
+
+
+def test_early_close_discards_the_partial_entry(tmp_path, cache_dir):
+    pdf = write_pdf(tmp_path / "rfp.pdf", ["one", "two", "three"])
+    pages = pdf_text.iter_pages(pdf)
+    assert next(pages) == "one"
+    pages.close()
+
+    assert os.listdir(cache_dir) == []
+    assert pdf_text.iter_cached_pages(pdf_text.file_sha256(pdf)) is None
+
+
+def test_parallel_extraction_keeps_page_order(tmp_path, cache_dir, monkeypatch):
+    texts = [f"Page {i}" for i in range(60)]
+    pdf = write_pdf(tmp_path / "bundle.pdf", texts)
+    monkeypatch.setattr(pdf_text, "PDF_PARALLEL_MIN_PAGES", 1)
+    assert pdf_text.extract_pages(pdf, max_workers=2) == texts
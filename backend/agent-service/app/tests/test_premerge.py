@@ -0,0 +1,34 @@
+from main_agent_module import dedupe_values, premerge_fragments
+
+
+def test_dedupe_ignores_case_whitespace_and_punctuation():
+    values = ["Rain Gauge, siphon type", "rain gauge,  siphon type.", "RAIN GAUGE, SIPHON TYPE"]
+    assert dedupe_values(values) == ["Rain Gauge, siphon type"]
+
+
+def test_dedupe_keeps_longer_near_duplicate():
+    values = ["Self recording rain gauge", "Self-recording rain gauges"]
+    assert dedupe_values(values) == ["Self-recording rain gauges"]
+
+
+def test_dedupe_never_merges_values_with_different_numbers():
+    pairs = [
+        ("Cable 4 core 10 sq mm", "Cable 4 core 16 sq mm"),
+        ("24-port managed switch", "48-port managed switch"),
+        ("FAT for 10% of items", "FAT for 20% of items"),
+    ]
+    for a, b in pairs:
+        assert dedupe_values([a, b]) == [a, b]
+
+
+def test_premerge_unions_lists_and_reports_scalar_conflicts():
+    fragments = [
+        {"RFP_Metadata": {"Title": "Supply of rain gauge"},
+         "Technical_Summary": {"Products_In_Scope": ["Cable 4 core 10 sq mm"]}},
+        {"RFP_Metadata": {"Title": "Supply of evaporimeter"},
+         "Technical_Summary": {"Products_In_Scope": ["Cable 4 core 16 sq mm", "cable 4 core 10 sq mm"]}},
+    ]
+    merged, conflicts = premerge_fragments(fragments)
+    assert merged["Technical_Summary"]["Products_In_Scope"] == ["Cable 4 core 10 sq mm", "Cable 4 core 16 sq mm"]
+    assert conflicts["RFP_Metadata.Title"] == ["Supply of rain gauge", "Supply of evaporimeter"]
+    assert merged["RFP_Metadata"]["Title"] == ""
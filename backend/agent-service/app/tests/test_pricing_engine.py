@@ -0,0 +1,87 @@
+from pricing_agent_module import PriceBook, compute_pricing, price_recommendation
+
+PRODUCT_PRICES = {
+    "RG-200": 12000,
+    "default_Rain Gauge": 9000,
+    "Rain Gauge": 8000,
+    "Evaporimeter": 15000.5,
+    "default_Zen": 5000,
+    "Acme": 4000,
+}
+SERVICE_PRICES = {"Installation & Commissioning": 10000, "FAT": 5000, "SAT": 7000,
+                  "Calibration Certificate": 3000, "Transport & Handling": 1500.5}
+
+
+def book():
+    return PriceBook(PRODUCT_PRICES, SERVICE_PRICES)
+
+
+def item(oem, model, product_type):
+    return {"OEM": oem, "Model": model, "Product_Type": product_type, "Specs": {}, "Semantic_Score": 90.0}
+
+
+def test_lookup_order():
+    prices = book()
+    assert prices.unit_price("RG-200", "Rain Gauge", "Acme") == 12000                # Model
+    assert prices.unit_price("RG-9", "Rain Gauge", "Acme") == 9000                   # default_<Product_Type>
+    assert prices.unit_price("EV-1", "Evaporimeter", "Acme") == 15001                # Product_Type, rounded
+    assert prices.unit_price("WS-5", "Weather Station", "Zen") == 5000               # default_<OEM>
+    assert prices.unit_price("WS-5", "Weather Station", "Acme") == 4000              # OEM
+    assert prices.unit_price("WS-5", "Weather Station", "Nobody") is None
+
+
+def test_lookup_ignores_case_and_whitespace():
+    prices = book()
+    assert prices.unit_price("  rg-200 ", None, None) == 12000
+    assert prices.unit_price(None, "rain   GAUGE", None) == 9000
+
+
+def test_unpriced_item_is_to_be_quoted():
+    rec = {"RFP_Product": "Weather station", "Top_OEM": "Nobody",
+           "Top_3_Recommendations": [item("Nobody", "WS-5", "Weather Station")]}
+    quote = price_recommendation(rec, book(), ["FAT"])["Winning_Quote"]
+    assert quote["Unit_Price_INR"] == "To Be Quoted"
+    assert quote["Total_Item_Cost"] == "To Be Quoted"
+    assert quote["Services_Cost_INR"] == 5000
+
+
+def test_winner_falls_back_to_first_recommendation():
+    rec = {"RFP_Product": "Rain gauge", "Top_OEM": "Unlisted",
+           "Top_3_Recommendations": [item("Acme", "RG-200", "Rain Gauge"), item("Zen", "RG-9", "Rain Gauge")]}
+    result = price_recommendation(rec, book(), [])
+    assert result["Winning_OEM"] == "Acme"
+    assert result["Winning_Quote"]["Model"] == "RG-200"
+
+    rec["Top_OEM"] = "Zen"
+    assert price_recommendation(rec, book(), [])["Winning_Quote"]["Model"] == "RG-9"
+
+    empty = price_recommendation({"RFP_Product": "Rain gauge", "Top_OEM": "Acme"}, book(), [])
+    assert empty["Status"] == "No Technical Match Found"
+
+
+def test_services_from_rfp_text():
+    rfp = {
+        "Pricing_Summary": {"Tests_Required": ["calibration  certificate from NABL lab"]},
+        "Technical_Summary": {"Tests_And_Standards": "Transport & Handling to site"},
+    }
+    assert book().services_for(rfp) == ["Installation & Commissioning", "FAT", "SAT",
+                                        "Calibration Certificate", "Transport & Handling"]
+    assert book().services_for({}) == ["Installation & Commissioning", "FAT", "SAT"]
+    assert book().services_cost(["Transport & Handling", "Unknown"]) == 1501
+
+
+def test_grand_total_skips_items_to_be_quoted():
+    tech = {"RFP_Technical_Recommendations": [
+        {"RFP_Product": "Rain gauge", "Top_OEM": "Acme", "Top_3_Recommendations": [item("Acme", "RG-200", "Rain Gauge")]},
+        {"RFP_Product": "Evaporimeter", "Top_OEM": "Acme", "Top_3_Recommendations": [item("Acme", "EV-1", "Evaporimeter")]},
+        {"RFP_Product": "Weather station", "Top_OEM": "Nobody",
+         "Top_3_Recommendations": [item("Nobody", "WS-5", "Weather Station")]},
+    ]}
+    result = compute_pricing(tech, {}, book())
+
+    services = 10000 + 5000 + 7000
+    totals = [entry["Winning_Quote"]["Total_Item_Cost"] for entry in result["Pricing_Summary"]]
+    assert totals == [12000 + services, 15001 + services, "To Be Quoted"]
+    assert result["Grand_Total_INR"] == 12000 + 15001 + 2 * services
+    # Same inputs, same quote.
+    assert compute_pricing(tech, {}, book()) == result
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+import main_agent_module
+from relevance import ChunkScorer, filter_chunks, RELEVANCE_FILTER, RELEVANCE_THRESHOLD
+
+COVER = """NATIONAL INSTITUTE OF TECHNOLOGY JAMSHEDPUR
+Tender No: NITJSR/CE/2025/17 Notice Inviting Tender for Supply of Rain Gauge.
+Last date for submission of bid: 15/11/2025 at 3:00 PM. Bid opening: 16/11/2025."""
+
+SPECS = """SCHEDULE OF REQUIREMENTS
+1. Self Recording Rain Gauge (Siphon type) Qty: 2 Nos.
+Specifications: Capacity: 10 mm siphoning, Accuracy: ±2%, Material: Brass funnel 200 mm dia.
+Conforming to IS 5235. Chart drum clock 7 days. Warranty 2 years. Installation and commissioning at site.
+2. Open Pan Evaporimeter Qty: 1 No. Range: 0-100 mm, Resolution 0.1 mm, IS 5973."""
+
+SUBSTATION_SCHEDULE = """SCHEDULE OF REQUIREMENTS
+1. 11/0.433 kV 1000 kVA distribution transformer, ONAN, IS 1180 - 2 Nos.
+2. 11 kV 3 core 240 sq mm XLPE cable, IS 7098 - 1500 m.
+3. 11 kV 630 A VCB panel with numerical relay, IEC 61850 compliant - 4 Sets.
+Type test and routine test reports to be submitted. Installation, testing and commissioning at site."""
+
+DECLARATION = """FORM-5 DECLARATION
+I/We hereby declare that I/we have read and understood all the terms and conditions of the tender and
+I/We hereby undertake to abide by them. I/We further declare that our firm has not been blacklisted by any
+Government department. The undertaking is given on our own free will. Signature of the Bidder with Seal of the firm.
+Name: ............ Designation: ............ Date: ............ Place: ............"""
+
+LEGAL = """GENERAL TERMS AND CONDITIONS
+Any dispute arising out of this contract shall be referred to arbitration under the Arbitration and Conciliation
+Act 1996. The courts at Jamshedpur shall have exclusive jurisdiction. Force majeure: Neither party shall be liable
+for delay caused by acts of God. Notwithstanding anything contained herein, the Institute reserves the right to
+accept or reject any bid without assigning any reason. The contractor shall indemnify the Institute against all
+claims. """ * 2
+
+PLAIN_NO = "Notwithstanding anything, there is no obligation. No claim. No extension. " * 10
+
+
+def test_field_texts_are_kept():
+    scorer = ChunkScorer()
+    for text in (COVER, SPECS, SUBSTATION_SCHEDULE):
+        assert scorer.score(text)["score"] >= RELEVANCE_THRESHOLD
+
+
+def test_boilerplate_is_low():
+    scorer = ChunkScorer()
+    for text in (DECLARATION, LEGAL, PLAIN_NO):
+        assert scorer.score(text)["score"] < RELEVANCE_THRESHOLD
+
+
+def test_schedule_followed_by_legal_text_is_kept():
+    scorer = ChunkScorer()
+    chunk = SUBSTATION_SCHEDULE + "\n" + LEGAL * 9
+    assert len(chunk) > 9000
+    assert scorer.score(chunk)["score"] >= RELEVANCE_THRESHOLD
+
+
+def test_plain_no_is_not_a_quantity():
+    assert ChunkScorer().keyword_score("There is no claim. No extension.") == 0.0
+
+
+def test_filter_keeps_first_chunk_and_defers_boilerplate():
+    filtered = []
+    chunks = [DECLARATION, SPECS, LEGAL, COVER]
+    kept = list(filter_chunks(chunks, ChunkScorer(), filtered, mode="defer", threshold=RELEVANCE_THRESHOLD))
+    assert kept == [(1, DECLARATION), (2, SPECS), (4, COVER), (3, LEGAL)]
+    assert [(entry["chunk"], entry["action"]) for entry in filtered] == [(3, "deferred")]
+
+
+def test_filter_drop_and_off():
+    chunks = [COVER, LEGAL, SPECS]
+    filtered = []
+    assert list(filter_chunks(chunks, ChunkScorer(), filtered, mode="drop")) == [(1, COVER), (3, SPECS)]
+    assert [(entry["chunk"], entry["action"]) for entry in filtered] == [(2, "dropped")]
+    assert list(filter_chunks(chunks, ChunkScorer(), [], mode="off")) == [(1, COVER), (2, LEGAL), (3, SPECS)]
+
+
+def test_default_drops_boilerplate():
+    assert RELEVANCE_FILTER == "drop"
+    chunks = [COVER, DECLARATION, SPECS, LEGAL, SUBSTATION_SCHEDULE, PLAIN_NO]
+    kept = [number for number, _ in filter_chunks(chunks, ChunkScorer(), [])]
+    assert kept == [1, 3, 5]
+
+
+@pytest.mark.parametrize("mode", ["drop", "defer"])
+def test_pipeline_reports_filtered_chunks_with_document_numbers(mode, tmp_path, monkeypatch):
+    chunks = [COVER, LEGAL, SPECS]
+    monkeypatch.setattr(main_agent_module, "iter_pages", lambda pdf_path: iter(chunks))
+    monkeypatch.setattr(main_agent_module, "iter_map_chunks", lambda pages: pages)
+    monkeypatch.setattr(main_agent_module, "get_chunk_output_cache", lambda *parts: None)
+    monkeypatch.setattr(main_agent_module, "RELEVANCE_FILTER", mode)
+    model = RunnableLambda(lambda prompt: json.dumps({"RFP_Metadata": {"Tender_Title": "Rain gauge"}}))
+
+    events = []
+    main_agent_module.main_agent_pipeline(model=model, pdf_path="rfp.pdf",
+                                          output_path=str(tmp_path / "rfp_summary.json"),
+                                          on_progress=events.append, chunk_scorer=ChunkScorer())
+    main_agent_module.flush_reports()
+
+    mapped = sorted(e["chunk"] for e in events if e["event"] == "chunk_completed")
+    report = json.loads((tmp_path / "low_relevance_chunks.json").read_text(encoding="utf-8"))
+    assert [entry["chunk"] for entry in report["chunks"]] == [2]
+    if mode == "drop":
+        assert mapped == [1, 3] and report["chunks_dropped"] == 1
+    else:
+        assert mapped == [1, 2, 3] and report["chunks_deferred"] == 1
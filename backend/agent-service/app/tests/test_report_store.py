@@ -0,0 +1,28 @@
+import json
+import threading
+
+import report_store
+from report_store import persist_json, flush
+
+
+def test_flush_waits_for_queued_reports(tmp_path, monkeypatch):
+    gate = threading.Event()
+    write = report_store.write_text_atomic
+
+    def slow_write(path, text):
+        gate.wait(5)
+        write(path, text)
+
+    monkeypatch.setattr(report_store, "write_text_atomic", slow_write)
+    data = {"RFP_Metadata": {"Title": "Rain gauge"}}
+    path = tmp_path / "reports" / "rfp_summary.json"
+    persist_json(str(path), data)
+    # Serialized at call time: later changes don't reach the file.
+    data["RFP_Metadata"]["Title"] = "changed"
+
+    flush(timeout=0.05)  # gives up at the deadline while the write is blocked
+    assert not path.exists()
+
+    gate.set()
+    flush()
+    assert json.loads(path.read_text())["RFP_Metadata"]["Title"] == "Rain gauge"
@@ -0,0 +1,24 @@
+import os
+
+import final
+
+
+def test_new_run_keeps_only_the_newest_workspaces(tmp_path, monkeypatch):
+    runs_dir = tmp_path / "runs"
+    monkeypatch.setattr(final, "RUNS_DIR", str(runs_dir))
+    monkeypatch.setattr(final, "RUNS_KEEP", 2)
+    for age, run_id in enumerate(["old", "older", "oldest"]):
+        (runs_dir / run_id).mkdir(parents=True)
+        os.utime(runs_dir / run_id, (1_000_000 - age, 1_000_000 - age))
+
+    state = final.new_run_state("rfp.pdf", run_id="new")
+
+    assert state["report_dir"] == os.path.join(str(runs_dir), "new")
+    assert sorted(os.listdir(runs_dir)) == ["new", "old"]
+
+
+def test_zero_keeps_every_workspace(tmp_path):
+    for run_id in ("a", "b", "c"):
+        (tmp_path / run_id).mkdir()
+    final.prune_runs(keep=0, runs_dir=str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["a", "b", "c"]
@@ -0,0 +1,97 @@
+"""
+Scraper tests against a local static tender site (tests/fixtures/tender_site) served
+by http.server. The browser test is skipped when Chromium is not installed
+(`playwright install chromium`).
+"""
+
+import os
+import shutil
+import asyncio
+import threading
+import functools
+from datetime import datetime
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+import scraper_engine
+from crawl_state import CrawlStateStore
+from playwright_scraper import download_all, select_candidates
+
+FIXTURE_SITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "tender_site")
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def tender_site(tmp_path):
+    """Serves a copy of the fixture site, with {{RECENT_DATE}} set to today; yields its base URL."""
+    root = tmp_path / "site"
+    shutil.copytree(FIXTURE_SITE, root)
+    listing = root / "listing.html"
+    listing.write_text(listing.read_text().replace("{{RECENT_DATE}}", datetime.now().strftime("%d/%m/%Y")))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_fixture_listing_filtering(tender_site):
+    # What LINK_SCAN_JS returns for the listing: each link with its table row as context.
+    bs4 = pytest.importorskip("bs4")
+    import requests
+    html = requests.get(f"{tender_site}/listing.html", timeout=5).text
+    links = [{"href": a["href"], "text": a.get_text(strip=True), "context": a.find_parent("tr").get_text(" ", strip=True)}
+             for a in bs4.BeautifulSoup(html, "html.parser").select("a[href]")]
+
+    candidates = select_candidates(links, f"{tender_site}/listing.html", 10)
+    assert [c["href"] for c in candidates] == [f"{tender_site}/docs/rain_gauge.pdf", f"{tender_site}/detail_ftir.html"]
+
+
+def test_download_all_is_incremental(tender_site, tmp_path):
+    state = CrawlStateStore(":memory:")
+    urls = [f"{tender_site}/docs/rain_gauge.pdf", f"{tender_site}/docs/ftir.pdf", f"{tender_site}/docs/missing.pdf"]
+
+    first = download_all(urls, str(tmp_path / "raw"), state=state)
+    assert [first[u] and first[u]["status"] for u in urls] == ["new", "new", None]
+    assert open(first[urls[0]]["path"], "rb").read().startswith(b"%PDF")
+
+    second = download_all(urls[:2], str(tmp_path / "raw"), state=state)
+    assert [second[u]["status"] for u in urls[:2]] == ["unchanged", "unchanged"]
+
+
+def test_run_scrape_on_fixture_site(tender_site, tmp_path, monkeypatch):
+    state = CrawlStateStore(":memory:")
+    monkeypatch.setattr(scraper_engine, "get_crawl_state", lambda: state)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    async def scrape_twice():
+        pool = scraper_engine.BrowserPool(headless=True, max_contexts=2)
+        try:
+            await pool.start()
+        except Exception as e:
+            pytest.skip(f"Chromium is not available: {str(e).splitlines()[0]}")
+        try:
+            first = await pool.run_scrape(f"{tender_site}/listing.html", str(tmp_path / "raw"), 10,
+                                          manifest_path=manifest_path, incremental=True)
+            second = await pool.run_scrape(f"{tender_site}/listing.html", str(tmp_path / "raw"), 10,
+                                           manifest_path=manifest_path, incremental=True)
+            return first, second
+        finally:
+            await pool.stop()
+
+    first, second = asyncio.run(scrape_twice())
+
+    # Direct PDF link and detail page are found; the old and off-topic rows are filtered out.
+    assert sorted(os.path.basename(e["pdf_url"]) for e in first) == ["ftir.pdf", "rain_gauge.pdf"]
+    assert all(e["status"] == "new" and os.path.exists(e["download_path"]) for e in first)
+    # Nothing changed on the site, so the incremental re-run lists nothing.
+    assert second == []
@@ -0,0 +1,52 @@
+import json
+
+from technical_agent_module import decide_by_score, recommend_products
+
+
+def match(oem, score):
+    return {"OEM": oem, "Model": f"{oem}-1", "Product_Type": "Rain Gauge", "Specs": {}, "Semantic_Score": score}
+
+
+class StubChain:
+    """Records the products it was asked about and answers with the first match's OEM."""
+
+    def __init__(self):
+        self.products = []
+
+    def batch(self, inputs, config=None, return_exceptions=False):
+        self.products.extend(item["product_name"] for item in inputs)
+        outputs = []
+        for item in inputs:
+            matches = json.loads(item["matches"])
+            outputs.append(json.dumps({
+                "RFP_Product": item["product_name"],
+                "Top_3_Recommendations": matches[:3],
+                "Top_OEM": matches[0]["OEM"] if matches else "None",
+            }))
+        return outputs
+
+
+def test_clear_winner_is_decided_by_score():
+    result = decide_by_score("gauge", [match("Acme", 90.0), match("Zen", 80.0)], margin=3.0)
+    assert result["Top_OEM"] == "Acme"
+    assert result["Decision_Source"] == "score"
+
+
+def test_empty_single_and_close_matches_go_to_llm():
+    assert decide_by_score("gauge", [], margin=3.0) is None
+    assert decide_by_score("gauge", [match("Acme", 90.0)], margin=3.0) is None
+    assert decide_by_score("gauge", [match("Acme", 90.0), match("Zen", 89.0)], margin=3.0) is None
+
+
+def test_recommend_products_records_decision_source():
+    chain = StubChain()
+    all_matches = [
+        [match("Acme", 90.0), match("Zen", 80.0)],
+        [match("Zen", 70.0)],
+        [],
+    ]
+    results = recommend_products(chain, ["clear", "single", "none"], all_matches, fast_path_margin=3.0)
+
+    assert chain.products == ["single", "none"]
+    assert [r["Decision_Source"] for r in results] == ["score", "llm", "llm"]
+    assert [r["Top_OEM"] for r in results] == ["Acme", "Zen", "None"]